@@ -7,6 +7,6 @@ import os
 import django
 from channels.routing import get_default_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "kronos_server.settings")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "host.settings")
 django.setup()
 application = get_default_application()
\ No newline at end of file
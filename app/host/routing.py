@@ -2,7 +2,7 @@
 from django.conf.urls import url
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
-from channels.security.websocket import AllowedHostsOriginValidator, OriginValidator
+from channels.security.websocket import AllowedHostsOriginValidator
 from main.consumers import MainConsumer
 
 application = ProtocolTypeRouter({
@@ -10,7 +10,7 @@ application = ProtocolTypeRouter({
         AuthMiddlewareStack(
             URLRouter(
                 [
-                    url(r"^messages/(?P<username>[\w.@+-]+)/$", MainConsumer)
+                    url(r"^messages/(?P<project_id>[0-9a-f-]{36})/$", MainConsumer)
                 ]
             )
         )
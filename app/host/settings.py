@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 import os
 import sys
 import mimetypes
+from collections import OrderedDict
 
 mimetypes.add_type('image/svg+xml', '.svg', True)
 
@@ -42,8 +43,9 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'channels',
     'django_archive',
-    'main',
+    'main.apps.MainConfig',
 ]
 
 MIDDLEWARE = [
@@ -90,21 +92,103 @@ LOGGING = {
             'level': 'WARNING',
             'propagate': True,
         },
+        'main': {
+            'handlers': ['file'],
+            'level': 'WARNING',
+            'propagate': True,
+        },
     },
 }
 
 WSGI_APPLICATION = 'host.wsgi.application'
-# ASGI_APPLICATION = 'host.routing.application'
+ASGI_APPLICATION = 'host.routing.application'
+
+# Channel layer carrying the change events of main.events to the /messages/ websockets:
+# memory or redis. memory only reaches websockets served by the same process, use redis
+# (pip install channels_redis) when the API and the websockets run in separate processes.
+CHANNEL_LAYER_BACKEND = os.getenv('CHANNEL_LAYER_BACKEND', 'memory')
+
+CHANNEL_LAYERS = {
+    'default': {
+        'memory': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+        'redis': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0')],
+            },
+        },
+    }[CHANNEL_LAYER_BACKEND],
+}
 
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# sqlite for development, postgresql for deployments and the test database of the
+# docker image. postgresql reads the DATABASE_* variables and keeps each connection
+# open for DATABASE_CONN_MAX_AGE seconds.
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'sqlite': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DATABASE_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        },
+        'postgresql': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DATABASE_NAME', 'samkit'),
+            'USER': os.getenv('DATABASE_USER', 'samkit'),
+            'PASSWORD': os.getenv('DATABASE_PASSWORD', ''),
+            'HOST': os.getenv('DATABASE_HOST', 'localhost'),
+            'PORT': os.getenv('DATABASE_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', '600')),
+        },
+    }[DATABASE_ENGINE],
+}
+
+# Run by main.db on every new SQLite connection, in this order. WAL lets the /api reads
+# go on while a write is committed and busy_timeout (ms) makes writers queue for the
+# lock instead of failing. mmap_size is in bytes, a negative cache_size is in KiB.
+SQLITE_PRAGMAS = OrderedDict([
+    ('journal_mode', os.getenv('SQLITE_JOURNAL_MODE', 'WAL')),
+    ('synchronous', os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')),
+    ('busy_timeout', int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))),
+    ('mmap_size', int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))),
+    ('cache_size', int(os.getenv('SQLITE_CACHE_SIZE', str(-64 * 1024)))),
+])
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+
+# Backend of the /api response cache (see main.cache): locmem, file or db.
+# locmem is private to each process, so multi-worker deployments should use
+# file, or db after running `manage.py createcachetable`, in every process that
+# writes to the database, manage.py commands included (the Dockerfile sets file).
+API_CACHE = 'api'
+API_CACHE_BACKEND = os.getenv('API_CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'api',
+        },
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        },
+        'db': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'api_cache',
+        },
+    }[API_CACHE_BACKEND],
 }
 
 
@@ -1,10 +1,23 @@
 ﻿# -*- coding: utf-8 -*-
 
+BATCH_SIZE = 1000
 
-def reset():
+# Stands for a name shared by several rows of a table in Loader.names.
+AMBIGUOUS = object()
+
+
+def reset(csv_path=None, merge=False, dry_run=False):
+    """Replace the core data with the content of setup.csv and return the changeset.
+
+    The header holds Table|field columns and cells reference rows of other tables as
+    Table|name. By default everything is deleted and reloaded; with merge the file is
+    diffed against the existing rows by natural key and only the differences are
+    written. Either way it runs in one transaction, which dry_run rolls back.
+    """
     import os
-    import csv
+    from django.db import transaction
     from main import models
+    from main.signals import bulk_changed
 
     tables = [
         models.Role,
@@ -12,69 +25,303 @@ def reset():
         models.Entity, models.Stage, models.Task
     ]
 
-    for table in tables:
-        for row in table.objects.all():
-            row.delete()
-
-    data = {}
-    csv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'setup.csv')
-    with open(csv_path, encoding='gb2312') as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        rows = [row for row in csv_reader]
-        cols = [col for col in zip(*rows)]
-        for header in rows[0]:
-            table, field = header.split('|')
-            for col in cols:
-                if col[0] == header:
-                    if not data.get(table, None):
-                        data[table] = list()
-                        for value in col[1:]:
-                            if value:
-                                data[table].append({field: value})
-                    else:
-                        for i in range(len(col[1:])):
-                            if col[1:][i]:
-                                data[table][i][field] = col[1:][i]
-                    break
-
-    instantiate(data)
-
-
-def instantiate(data, table=None):
-    from . import models
-    if not table:
-        for table in data:
-            instantiate(data, table)
-        return
-
-    for i in range(len(data[table])):
-        row = data[table][i]
-        if type(row) is dict:
-            for ref in foreign_key(data, table):
-                if ref == 'User':
+    if not csv_path:
+        csv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'setup.csv')
+
+    loader = Loader(csv_path, merge=merge)
+    with transaction.atomic():
+        projects = set(models.Project.objects.values_list('id', flat=True))
+        if not merge:
+            for index, table in enumerate(reversed(tables)):
+                delete(table.objects.all(), cleared=tables[len(tables) - index:])
+        loader.load()
+        models.Task.setup()
+        projects.update(models.Project.objects.values_list('id', flat=True))
+        if dry_run:
+            transaction.set_rollback(True)
+
+    if not dry_run:
+        # The clients of every project, removed ones included, reload their entities.
+        if not any(labels for changeset in loader.changes.values() for labels in changeset.values()):
+            projects = set()
+        for table in tables:
+            bulk_changed.send(sender=table, projects=projects if table is models.Entity else None)
+    return loader.changes
+
+
+def delete(queryset, cleared=()):
+    """Delete the rows of a queryset with plain DELETE statements, cascades included.
+
+    QuerySet.delete() loads every row and sends its post_delete whenever a receiver
+    listens, main.cache and main.events do, so bulk writers call this and send one
+    bulk_changed per table instead. Models in cleared are already empty and skipped.
+    """
+    from django.db import models
+
+    model = queryset.model
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through._base_manager
+        through.filter(**{'%s__in' % field.m2m_field_name(): queryset})._raw_delete(queryset.db)
+    for relation in model._meta.related_objects:
+        if relation.many_to_many:
+            through = relation.through._base_manager
+            through.filter(**{'%s__in' % relation.field.m2m_reverse_field_name(): queryset})._raw_delete(queryset.db)
+            continue
+        if relation.related_model in cleared:
+            continue
+        related = relation.related_model._base_manager.filter(**{'%s__in' % relation.field.name: queryset})
+        if relation.on_delete is models.CASCADE:
+            delete(related, cleared)
+        elif relation.on_delete is models.SET_NULL:
+            related.update(**{relation.field.name: None})
+    queryset._raw_delete(queryset.db)
+
+
+class Loader(object):
+    """Streams a setup csv into the database.
+
+    Tables are ordered by their references once, then each one is read in its own pass
+    over the file and written with bulk_create. References resolve through name -> pk
+    dictionaries, so the memory held is one batch of rows plus the names seen so far.
+    """
+
+    ENCODING = 'gb2312'
+
+    # Rows of the file match existing rows on these fields in merge mode.
+    NATURAL_KEYS = {
+        'Role': ('name', ),
+        'Profile': ('user', ),
+        'Project': ('name', ),
+        'Genus': ('name', ),
+        'Tag': ('project', 'name'),
+        'Entity': ('tag', 'name'),
+        'Stage': ('project', 'name'),
+    }
+
+    def __init__(self, csv_path, merge=False):
+        from collections import OrderedDict
+
+        self.csv_path = csv_path
+        self.merge = merge
+        self.names = {}
+        self.batches = None
+        self.existing = {}
+        self.creates = OrderedDict()
+        self.updates = OrderedDict()
+        self.changes = OrderedDict()
+        self.columns = self.read_header()
+        self.tables = self.order()
+
+    def open(self):
+        return open(self.csv_path, encoding=self.ENCODING, newline='')
+
+    def read_header(self):
+        import csv
+        from collections import OrderedDict
+
+        columns = OrderedDict()
+        with self.open() as csv_file:
+            for index, header in enumerate(next(csv.reader(csv_file))):
+                table, field = header.split('|')
+                columns.setdefault(table, []).append((index, field))
+        return columns
+
+    def rows(self, table):
+        """Yield the filled cells of a table per line, a row exists where its first column is set."""
+        import csv
+
+        columns = self.columns[table]
+        with self.open() as csv_file:
+            reader = csv.reader(csv_file)
+            next(reader)
+            for line in reader:
+                row = {field: line[index] for index, field in columns if index < len(line) and line[index]}
+                if columns[0][1] in row:
+                    yield row
+
+    def order(self):
+        """Return the tables of the file, each one after the tables it references."""
+        from django.core.exceptions import FieldDoesNotExist
+        from main import models
+
+        references = {}
+        for table, columns in self.columns.items():
+            model = getattr(models, table)
+            references[table] = set()
+            for _, field in columns:
+                try:
+                    target = model._meta.get_field(field)
+                except FieldDoesNotExist:
+                    continue
+                if not (target.many_to_one or target.one_to_one):
+                    continue
+                if target.related_model is not model and target.related_model.__name__ in self.columns:
+                    references[table].add(target.related_model.__name__)
+
+        ordered = []
+
+        def visit(table, path):
+            if table in ordered:
+                return
+            if table in path:
+                raise ValueError('Circular reference: %s' % ' -> '.join(path + [table]))
+            for reference in sorted(references[table]):
+                visit(reference, path + [table])
+            ordered.append(table)
+
+        for table in self.columns:
+            visit(table, [])
+        return ordered
+
+    def lookup(self, table):
+        """Return the name -> pk dictionary of a table, reading tables outside the file once."""
+        from main import models
+
+        if table not in self.names:
+            key = 'username' if table == 'User' else 'name'
+            self.names[table] = {}
+            for name, pk in getattr(models, table).objects.values_list(key, 'pk'):
+                self.add_name(self.names[table], name, pk)
+        return self.names[table]
+
+    def add_name(self, names, name, pk):
+        if names.get(name, pk) != pk:
+            pk = AMBIGUOUS
+        names[name] = pk
+
+    def resolve(self, table, name, where):
+        """Return the pk of the only row of a table with that name, as referenced by Table|name."""
+        pk = self.lookup(table).get(name)
+        if pk is None:
+            raise ValueError('Unknown reference %s|%s in %s' % (table, name, where))
+        if pk is AMBIGUOUS:
+            raise ValueError('Ambiguous reference %s|%s in %s, several rows have that name' % (table, name, where))
+        return pk
+
+    def load(self):
+        from main import models
+
+        for table in self.tables:
+            self.load_table(table)
+        if self.merge:
+            for table in reversed(self.tables):
+                model = getattr(models, table)
+                stale = [obj for obj in self.rows_of(model).values() if not obj.seen]
+                self.changes.setdefault(table, self.changeset())['delete'] += [self.label(obj) for obj in stale]
+                if stale:
+                    delete(model.objects.filter(pk__in=[obj.pk for obj in stale]))
+
+    def load_table(self, table):
+        from main import models
+
+        model = getattr(models, table)
+        names = self.names.setdefault(table, {})
+        count = 0
+        for row in self.rows(table):
+            values = {}
+            for field, value in row.items():
+                if '|' not in value:
+                    values[field] = value
+                    continue
+                target, name = value.split('|')
+                if not name:
                     continue
-                instantiate(data, ref)
-            row_edit = {}
-            for k, v in row.items():
-                if '|' in v:
-                    target, name = v.split('|')
-                    if not name:
-                        continue
-                    target_class = getattr(models, target)
-                    kwarg = 'username' if target == 'User' else 'name'
-                    row[k] = target_class.objects.get(**{kwarg: name})
-                row_edit[k] = row[k]
-            table_class = getattr(models, table)
-            data[table][i] = table_class(**row_edit)
-            data[table][i].save()
-
-
-def foreign_key(data, table):
-    for row in data[table]:
-        if type(row) is dict:
-            for k, v in row.items():
-                if '|' in v:
-                    yield v.split('|')[0]
+                values[model._meta.get_field(field).attname] = self.resolve(target, name, '%s|%s' % (table, field))
+
+            obj = self.put(model, values)
+            self.add_name(names, getattr(obj, 'name', None), obj.pk)
+            if table == 'Entity':
+                self.mirror(obj)
+            count += 1
+            if count % BATCH_SIZE == 0:
+                self.flush()
+        self.flush()
+
+    def rows_of(self, model):
+        """Return the existing rows of a model by natural key, read once in merge mode.
+
+        Raises ValueError when several rows share a natural key, merge could neither
+        update the right one nor tell whether the others are stale.
+        """
+        table = model.__name__
+        if table not in self.existing:
+            self.existing[table] = {}
+            for row in model.objects.all():
+                row.seen = False
+                key = self.natural_key(model, row)
+                if key in self.existing[table]:
+                    raise ValueError('Several %s rows named %s share the key %s, merge cannot tell them apart' % (
+                        table, self.label(row), ', '.join(self.NATURAL_KEYS[table])))
+                self.existing[table][key] = row
+        return self.existing[table]
+
+    def to_python(self, model, attname, value):
+        for field in model._meta.concrete_fields:
+            if field.attname == attname:
+                return field.to_python(value)
+        return value
+
+    def natural_key(self, model, obj):
+        return tuple(getattr(obj, model._meta.get_field(field).attname) for field in self.NATURAL_KEYS[model.__name__])
+
+    def label(self, obj):
+        return str(getattr(obj, 'name', obj.pk))
+
+    def changeset(self):
+        return {'create': [], 'update': [], 'delete': []}
+
+    def put(self, model, values):
+        """Queue the insert of a row, or in merge mode the update of the existing row with the same natural key."""
+        table = model.__name__
+        changes = self.changes.setdefault(table, self.changeset())
+        obj = model(**values)
+        if self.merge:
+            current = self.rows_of(model).get(self.natural_key(model, obj))
+            if current is not None:
+                current.seen = True
+                fields = [field for field in values if getattr(current, field) != self.to_python(model, field, values[field])]
+                for field in fields:
+                    setattr(current, field, getattr(obj, field))
+                if fields:
+                    self.updates.setdefault(model, ([], set()))[0].append(current)
+                    self.updates[model][1].update(fields)
+                    changes['update'].append(self.label(current))
+                return current
+
+        self.creates.setdefault(model, []).append(obj)
+        changes['create'].append(self.label(obj))
+        return obj
+
+    def mirror(self, entity):
+        """Queue the shot tag of a batch entity like Entity.save, later rows may reference it."""
+        from main import models
+
+        if self.batches is None:
+            self.batches = dict(models.Tag.objects.filter(genus__name='batch').values_list('pk', 'project_id'))
+        if entity.tag_id not in self.batches:
+            return
+        tags = self.lookup('Tag')
+        if entity.name in tags:
+            return
+        tag = self.put(models.Tag, {
+            'project_id': self.batches[entity.tag_id],
+            'genus_id': self.resolve('Genus', 'shot', 'the shot tag of %s' % entity.name),
+            'name': entity.name,
+            'info': entity.info,
+        })
+        self.add_name(tags, tag.name, tag.pk)
+
+    def flush(self):
+        """Write the queued rows, referenced tables first."""
+        from main import models
+
+        for table in self.tables:
+            model = getattr(models, table)
+            if self.creates.get(model):
+                model.objects.bulk_create(self.creates.pop(model))
+            if self.updates.get(model):
+                rows, fields = self.updates.pop(model)
+                model.objects.bulk_update(rows, fields)
 
 
 if __name__ == "__main__":
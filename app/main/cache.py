@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import uuid
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from main import models
+from main.signals import bulk_changed
+
+
+# Models whose rows end up in the response of each /api table.
+DEPENDENCIES = {
+    'project': ('Project', ),
+    'genus': ('Genus', ),
+    'tag': ('Tag', 'Project', 'Genus'),
+    'entity': ('Entity', 'Tag', 'Project', 'Genus'),
+    'stage': ('Stage', 'Project', 'Genus'),
+    'task': ('Task', 'Stage', 'Entity', 'Tag', 'Project', 'Genus', 'User'),
+}
+
+VERSION_KEY = 'api:version:%s'
+RESPONSE_KEY = 'api:response:%s:%s'
+
+
+def backend():
+    return caches[getattr(settings, 'API_CACHE', 'default')]
+
+
+def versions(table):
+    """Return the current version of every model the table depends on."""
+    return model_versions(DEPENDENCIES[table])
+
+
+def model_versions(names):
+    keys = [VERSION_KEY % name for name in names]
+    current = backend().get_many(keys)
+    for key in keys:
+        if key not in current:
+            # A lost version restarts from a fresh value, never from one a stale response was stored under.
+            backend().add(key, new_version(), None)
+            current[key] = backend().get(key)
+    return [current[key] for key in keys]
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+def bump(name):
+    # A plain set() of a value never used before: incr() is a get and a set on the file
+    # and db backends, two processes bumping at once could both write the same number.
+    backend().set(VERSION_KEY % name, new_version(), None)
+
+
+def bump_on_commit(name):
+    """Bump a model version for a write, again once its transaction commits.
+
+    Until the commit other processes still read the old rows and may cache them under
+    the version bumped first, the second bump makes those entries unreachable.
+    """
+    if transaction.get_connection().in_atomic_block:
+        bump(name)
+    transaction.on_commit(lambda: bump(name))
+
+
+# Hits and misses of fetch() in this process, kept in memory for the same reason.
+counters = Counter()
+counters_lock = threading.Lock()
+
+
+def count(name):
+    with counters_lock:
+        counters[name] += 1
+
+
+def stats():
+    """Hits and misses of the process answering, each uWSGI worker counts its own."""
+    with counters_lock:
+        return {'hit': counters['hit'], 'miss': counters['miss']}
+
+
+def fingerprint(table, filters):
+    """Digest of a table listing that changes whenever one of its models is written."""
+    digest = hashlib.md5(json.dumps([table, sorted(filters.items()), versions(table)]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def fetch(table, filters, build, digest=None):
+    """Return the cached response body of a table listing, calling build() on a miss."""
+    key = RESPONSE_KEY % (table, digest or fingerprint(table, filters))
+    body = backend().get(key)
+    if body is not None:
+        count('hit')
+        return body
+
+    count('miss')
+    body = build()
+    backend().set(key, body)
+    return body
+
+
+class Registry(object):
+    """Process level copy of a small table, reloaded whenever the model version changes.
+
+    Checking the version is a single cache lookup, so a warm registry costs no query.
+    """
+
+    def __init__(self, name, load):
+        self.name = name
+        self.load = load
+        self.version = None
+        self.data = None
+
+    def get(self):
+        version = model_versions([self.name])[0]
+        if version != self.version:
+            self.data = self.load()
+            self.version = version
+        return self.data
+
+
+genera = Registry('Genus', lambda: {gns.name: gns for gns in models.Genus.objects.all()})
+projects = Registry('Project', lambda: list(models.Project.objects.all()))
+tag_projects = Registry('Tag', lambda: dict(models.Tag.objects.values_list('id', 'project_id')))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def model_changed(sender, update_fields=None, **kwargs):
+    if sender is models.User and update_fields and set(update_fields) == {'last_login'}:
+        return
+    if getattr(models, sender.__name__, None) is sender:
+        bump_on_commit(sender.__name__)
+
+
+@receiver(bulk_changed)
+def model_bulk_changed(sender, **kwargs):
+    bump_on_commit(sender.__name__)
+
+
+@receiver(m2m_changed, sender=models.Entity.link.through)
+def entity_link_changed(action, **kwargs):
+    if action.startswith('post_'):
+        bump_on_commit('Entity')
@@ -1,44 +1,24 @@
 ﻿# -*- coding: utf-8 -*-
-# from channels import Group
-# from channels.auth import channel_session_user, channel_session_user_from_http
-import asyncio
 import json
-from django.contrib.auth import get_user_model
-from channels.consumer import AsyncConsumer
-from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
 
+from main import events
 
-class MainConsumer(AsyncConsumer):
-    async def websocket_connect(self, event):
-        print('connected', event)
 
-    async def websocket_receive(self, event):
-        print('received', event)
+class MainConsumer(AsyncWebsocketConsumer):
+    """Pushes the change events of a project (see main.events) to a websocket client.
 
-    async def websocket_disconnect(self, event):
-        print('disconnected', event)
+    Each message is one compact JSON event, e.g. {"name": "task.owner", "id": ..., "owner": ...}.
+    Bulk writes send {"name": "entity.bulk"} or {"name": "task.bulk"}, the client then reloads that listing.
+    """
 
+    async def connect(self):
+        self.group = events.group(self.scope['url_route']['kwargs']['project_id'])
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
 
-"""
-# Connected to websocket.connect
-@channel_session_user_from_http
-def ws_add(message):
-    # Accept connection
-    message.reply_channel.send({"accept": True})
-    # Add them to the right group
-    Group(message.user.username).add(message.reply_channel)
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group, self.channel_name)
 
-
-# Connected to websocket.receive
-@channel_session_user
-def ws_message(message):
-    Group(message.user.username).send({
-        "text": message['text'],
-    })
-
-
-# Connected to websocket.disconnect
-@channel_session_user
-def ws_disconnect(message):
-    Group(message.user.username).discard(message.reply_channel)
-"""
\ No newline at end of file
+    async def change(self, message):
+        await self.send(text_data=json.dumps(message['event']))
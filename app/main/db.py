@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def pragmas():
+    """Return the (pragma, value) pairs of settings.SQLITE_PRAGMAS, None values are skipped."""
+    return [(pragma, value) for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items()
+            if value is not None]
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in pragmas():
+            cursor.execute('PRAGMA %s = %s' % (pragma, value))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from main import cache, models
+from main.signals import bulk_changed, owner_changed
+
+
+logger = logging.getLogger(__name__)
+
+
+def group(project_id):
+    """Channel group of the websocket clients following a project."""
+    return 'project.%s' % project_id
+
+
+def broadcast(project_id, **event):
+    """Send a change event to the clients of a project once the current transaction commits."""
+    layer = get_channel_layer()
+    if layer is None or project_id is None:
+        return
+
+    def send():
+        try:
+            async_to_sync(layer.group_send)(group(project_id), {'type': 'change', 'event': event})
+        except Exception:
+            # The write already happened, a lost notification only delays the clients.
+            logger.warning('Failed to broadcast %s', event, exc_info=True)
+
+    transaction.on_commit(send)
+
+
+def tag_project(tag_id):
+    return models.Tag.objects.filter(id=tag_id).values_list('project_id', flat=True).first()
+
+
+def stage_project(stage_id):
+    return models.Stage.objects.filter(id=stage_id).values_list('project_id', flat=True).first()
+
+
+@receiver(post_save, sender=models.Task)
+def task_saved(sender, instance, created, **kwargs):
+    # Tasks are created in bulk, a saved task had its owner edited.
+    if not created:
+        owner = instance.owner.username if instance.owner_id else None
+        broadcast(stage_project(instance.stage_id), name='task.owner', id=str(instance.id), owner=owner)
+
+
+@receiver(owner_changed, sender=models.Task)
+def task_owner_changed(sender, task_id, owner, **kwargs):
+    stage_id = models.Task.objects.filter(id=task_id).values_list('stage_id', flat=True).first()
+    broadcast(stage_project(stage_id), name='task.owner', id=str(task_id), owner=owner.username if owner else None)
+
+
+@receiver(post_save, sender=models.Entity)
+def entity_saved(sender, instance, created, **kwargs):
+    if models.Entity.tag.is_cached(instance):
+        project_id = instance.tag.project_id
+    else:
+        project_id = tag_project(instance.tag_id)
+    broadcast(
+        project_id,
+        name='entity.added' if created else 'entity.updated',
+        id=str(instance.id), tag_id=str(instance.tag_id), entity=instance.name,
+    )
+
+
+@receiver(post_delete, sender=models.Entity)
+def entity_deleted(sender, instance, **kwargs):
+    # From the registry, a cascade deleting many entities reads the tags once.
+    project_id = cache.tag_projects.get().get(instance.tag_id)
+    if project_id is None:
+        project_id = tag_project(instance.tag_id)
+    broadcast(project_id, name='entity.deleted', id=str(instance.id))
+
+
+@receiver(bulk_changed)
+def rows_bulk_changed(sender, projects=None, **kwargs):
+    # One event per project, the clients reload the listing instead of patching rows.
+    if sender in (models.Entity, models.Task):
+        for project_id in projects or ():
+            broadcast(project_id, name='%s.bulk' % sender.__name__.lower())
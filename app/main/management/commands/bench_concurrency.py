@@ -0,0 +1,102 @@
+import time
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from main import models
+
+
+class Command(BaseCommand):
+    help = 'Measure /api/task reads while other threads reassign tasks with Task.set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run')
+        parser.add_argument('--project', help='Project read from /api/task, the first one with tasks by default')
+        parser.add_argument('--pragma', action='append', default=[], metavar='NAME=VALUE',
+                            help='Override an entry of SQLITE_PRAGMAS, e.g. journal_mode=DELETE '
+                                 '(the journal mode sticks to the database file until changed back)')
+
+    def handle(self, *args, **options):
+        if options['pragma']:
+            # Applied by main.db as the threads open their own connections.
+            pragmas = OrderedDict(settings.SQLITE_PRAGMAS)
+            pragmas.update(pragma.split('=', 1) for pragma in options['pragma'])
+            settings.SQLITE_PRAGMAS = pragmas
+            connection.close()
+
+        tasks = models.Task.objects.all()
+        if options['project']:
+            tasks = tasks.filter(stage__project__name=options['project'])
+        task = tasks.select_related('stage__project').first()
+        if task is None:
+            raise CommandError('No tasks to work on, load some data with manage.py setup first')
+        project = task.stage.project.name
+        task_ids = [str(pk) for pk in tasks.values_list('id', flat=True)[:1000]]
+        user = User.objects.first()
+        owners = [user.username if user else '', '']
+        connection.close()
+
+        stop = threading.Event()
+        reads, writes, errors = [], [], []
+
+        def read():
+            client = Client()
+            while not stop.is_set():
+                start = time.time()
+                try:
+                    response = client.get('/api/task', {'project': project})
+                except Exception as e:
+                    errors.append('read %s' % e)
+                    continue
+                if response.status_code == 200:
+                    reads.append(time.time() - start)
+                else:
+                    errors.append('read %d' % response.status_code)
+
+        def write(offset):
+            count = offset
+            while not stop.is_set():
+                start = time.time()
+                try:
+                    models.Task.set({'id': [task_ids[count % len(task_ids)]], 'owner': [owners[count % 2]]})
+                    writes.append(time.time() - start)
+                except Exception as e:
+                    errors.append('write %s' % e)
+                count += 1
+
+        def run(target, *args):
+            try:
+                target(*args)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(read, )) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=run, args=(write, index)) for index in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        self.stdout.write('pragmas: %s' % ', '.join('%s=%s' % pair for pair in settings.SQLITE_PRAGMAS.items()))
+        self.report('reads', reads, options['duration'])
+        self.report('writes', writes, options['duration'])
+        self.stdout.write('errors: %d' % len(errors))
+        for error in sorted(set(errors)):
+            self.stdout.write('    %s' % error)
+
+    def report(self, label, timings, duration):
+        if not timings:
+            self.stdout.write('%s: none' % label)
+            return
+        timings = sorted(timings)
+        self.stdout.write('%s: %d, %.1f/s, p50 %.1f ms, p95 %.1f ms, max %.1f ms' % (
+            label, len(timings), len(timings) / duration,
+            timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.95)] * 1000, timings[-1] * 1000))
@@ -0,0 +1,65 @@
+import time
+import threading
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Compare the latency of API urls, e.g. the same listing served by uWSGI and by daphne'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', nargs='+',
+                            help='e.g. http://127.0.0.1/api/task (uWSGI) http://127.0.0.1:8000/api/task (daphne)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Clients per url')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per url')
+
+    def handle(self, *args, **options):
+        for url in options['url']:
+            timings, errors = self.load(url, options['concurrency'], options['duration'])
+            self.report(url, timings, errors, options['duration'])
+
+    def load(self, url, concurrency, duration):
+        """Keep concurrency keep-alive clients requesting url for duration seconds."""
+        parts = urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        deadline = time.time() + duration
+        timings, errors = [], []
+
+        def client():
+            connection = HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            while time.time() < deadline:
+                start = time.time()
+                try:
+                    connection.request('GET', path)
+                    response = connection.getresponse()
+                    response.read()
+                except Exception as e:
+                    errors.append(str(e) or e.__class__.__name__)
+                    connection.close()
+                    continue
+                if response.status == 200:
+                    timings.append(time.time() - start)
+                else:
+                    errors.append('HTTP %d' % response.status)
+            connection.close()
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, errors
+
+    def report(self, url, timings, errors, duration):
+        self.stdout.write(url)
+        if timings:
+            timings = sorted(timings)
+            self.stdout.write('    %d requests, %.1f/s, p50 %.1f ms, p95 %.1f ms, p99 %.1f ms, max %.1f ms' % (
+                len(timings), len(timings) / duration,
+                timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.95)] * 1000,
+                timings[int(len(timings) * 0.99)] * 1000, timings[-1] * 1000))
+        self.stdout.write('    errors: %d' % len(errors))
+        for error in sorted(set(errors)):
+            self.stdout.write('        %s' % error)
@@ -0,0 +1,112 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from main import models
+
+
+# Columns of the indexes added by migrations 0002 and 0003, by table.
+INDEXES = {
+    models.Genus: ['name'],
+    models.Tag: ['project_id', 'genus_id', 'name'],
+    models.Entity: ['tag_id', 'name'],
+    models.Stage: ['project_id', 'genus_id', 'name'],
+    models.Task: ['entity_id', 'stage_id'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare the query plans and timings of the hot lookups with and without the indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=5000,
+                            help='Entities seeded into a throwaway project, 0 to use the current data')
+        parser.add_argument('--repeat', type=int, default=200, help='Runs of each query to time')
+
+    def handle(self, *args, **options):
+        # Everything, seed data and dropped indexes included, is rolled back.
+        with transaction.atomic():
+            samples = self.seed(options['seed']) if options['seed'] else self.samples()
+            queries = self.queries(*samples)
+            self.stdout.write('== without indexes')
+            dropped = self.drop_indexes()
+            self.report(queries, options['repeat'])
+            for sql in dropped:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql)
+            self.stdout.write('== with indexes')
+            self.report(queries, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        genera = {}
+        for name in ('asset', 'shot', 'batch'):
+            genera[name] = models.Genus.objects.get_or_create(name=name, defaults={'info': name})[0]
+        project = models.Project(name='query_plans', info='query_plans')
+        project.save()
+        tags = list(models.Tag.objects.filter(project=project, genus=genera['asset']))
+        models.Entity.objects.bulk_create([
+            models.Entity(tag=tags[index % len(tags)], name='ent%06d' % index) for index in range(count)
+        ])
+        models.Task.setup(project=project)
+        owner = User.objects.create_user('query_plans')
+        models.Task.objects.filter(stage__project=project, entity__name__endswith='0').update(owner=owner)
+        with connection.cursor() as cursor:
+            for model in INDEXES:
+                cursor.execute('ANALYZE %s' % connection.ops.quote_name(model._meta.db_table))
+        return self.samples(project)
+
+    def samples(self, project=None):
+        tasks = models.Task.objects.select_related('entity__tag', 'stage__genus', 'owner')
+        if project is not None:
+            tasks = tasks.filter(stage__project=project)
+        task = tasks.filter(owner__isnull=False).first() or tasks.first()
+        if task is None:
+            raise ValueError('No tasks to sample, run with --seed')
+        return task.entity, task.stage, task.owner
+
+    def queries(self, entity, stage, owner):
+        tag = entity.tag
+        return [
+            ('Genus.name', lambda: models.Genus.objects.filter(name=stage.genus.name)),
+            ('Tag(project, genus, name)', lambda: models.Tag.objects.filter(
+                project_id=tag.project_id, genus_id=tag.genus_id, name=tag.name)),
+            ('Entity(tag, name)', lambda: models.Entity.objects.filter(tag=tag, name=entity.name)),
+            ('Stage(project, genus, name)', lambda: models.Stage.objects.filter(
+                project_id=stage.project_id, genus_id=stage.genus_id, name=stage.name)),
+            ('Task(entity, stage)', lambda: models.Task.objects.filter(entity=entity, stage=stage)),
+            ('Task(owner)', lambda: models.Task.objects.filter(owner=owner)),
+        ]
+
+    def drop_indexes(self):
+        """Drop the indexes of migrations 0002 and 0003 and return the statements recreating them."""
+        with connection.cursor() as cursor:
+            recreate = []
+            for model, columns in INDEXES.items():
+                table = connection.ops.quote_name(model._meta.db_table)
+                constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                for index, info in constraints.items():
+                    if info['columns'] != columns or info['primary_key'] or info['foreign_key']:
+                        continue
+                    name = connection.ops.quote_name(index)
+                    fields = ', '.join(connection.ops.quote_name(column) for column in columns)
+                    if info['index']:
+                        recreate.append('CREATE %sINDEX %s ON %s (%s)' % (
+                            'UNIQUE ' if info['unique'] else '', name, table, fields))
+                        cursor.execute('DROP INDEX %s' % name)
+                    elif info['unique']:
+                        # PostgreSQL unique_together is a constraint owning its index.
+                        recreate.append('ALTER TABLE %s ADD CONSTRAINT %s UNIQUE (%s)' % (table, name, fields))
+                        cursor.execute('ALTER TABLE %s DROP CONSTRAINT %s' % (table, name))
+        return recreate
+
+    def report(self, queries, repeat):
+        for label, query in queries:
+            start = time.time()
+            for _ in range(repeat):
+                list(query())
+            elapsed = (time.time() - start) * 1000 / repeat
+            self.stdout.write('%s: %.3f ms' % (label, elapsed))
+            for line in query().explain().splitlines():
+                self.stdout.write('    %s' % line)
@@ -5,10 +5,27 @@ import main
 class Command(BaseCommand):
     help = 'Setup core data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', nargs='?', help='setup csv, defaults to setup.csv')
+        parser.add_argument('--merge', action='store_true',
+                            help='Diff against the existing rows and only write the differences')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the changeset without writing it')
+
     def handle(self, *args, **options):
         try:
-            main.reset()
+            changes = main.reset(options['csv_path'], merge=options['merge'], dry_run=options['dry_run'])
         except Exception as e:
-            self.stderr.write(e)
+            self.stderr.write(str(e))
             return
-        self.stdout.write('Data Setup Successful')
+        for table, changeset in changes.items():
+            self.stdout.write('%s: %d created, %d updated, %d deleted' % (
+                table, len(changeset['create']), len(changeset['update']), len(changeset['delete'])))
+            if options['verbosity'] > 1:
+                for action in ('create', 'update', 'delete'):
+                    for label in changeset[action]:
+                        self.stdout.write('  %s %s' % (action, label))
+        if options['dry_run']:
+            self.stdout.write('Dry run, nothing written')
+        else:
+            self.stdout.write('Data Setup Successful')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from main import models
+
+
+class Command(BaseCommand):
+    help = 'Create the missing tasks of every entity and stage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', nargs='*', help='Project names, all projects when omitted')
+
+    def handle(self, *args, **options):
+        projects = models.Project.objects.all()
+        if options['project']:
+            projects = projects.filter(name__in=options['project'])
+        for project in projects:
+            count = models.Task.setup(project=project)
+            self.stdout.write('%s: %d task(s) created' % (project.name, count))
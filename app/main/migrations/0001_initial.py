@@ -0,0 +1,100 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Entity',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('info', models.CharField(blank=True, max_length=200)),
+                ('thumb', models.ImageField(default='thumbs/default.png', upload_to='thumbs')),
+                ('link', models.ManyToManyField(blank=True, to='main.Entity')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Genus',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=10)),
+                ('info', models.CharField(blank=True, max_length=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Project',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50)),
+                ('info', models.CharField(blank=True, max_length=200)),
+                ('fps', models.IntegerField(default=25)),
+                ('camera', models.CharField(default='MainCAM', max_length=50)),
+                ('root', models.CharField(default='file:///P:', max_length=200)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Role',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(default='artist', max_length=50)),
+                ('info', models.CharField(default='artist', max_length=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Stage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50)),
+                ('info', models.CharField(blank=True, max_length=50)),
+                ('source', models.CharField(default='/', max_length=200)),
+                ('data', models.CharField(default='/', max_length=200)),
+                ('genus', models.ForeignKey(default=uuid.uuid4, on_delete=django.db.models.deletion.CASCADE, to='main.Genus')),
+                ('project', models.ForeignKey(default=uuid.uuid4, on_delete=django.db.models.deletion.CASCADE, to='main.Project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('entity', models.ForeignKey(default=uuid.uuid4, on_delete=django.db.models.deletion.CASCADE, to='main.Entity')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('stage', models.ForeignKey(default=uuid.uuid4, on_delete=django.db.models.deletion.CASCADE, to='main.Stage')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50)),
+                ('info', models.CharField(blank=True, max_length=50)),
+                ('genus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.Genus')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.Project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(default='artist', max_length=50)),
+                ('role', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='main.Role')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='entity',
+            name='tag',
+            field=models.ForeignKey(default=uuid.uuid4, on_delete=django.db.models.deletion.CASCADE, to='main.Tag'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='genus',
+            name='name',
+            field=models.CharField(db_index=True, max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='entity',
+            index=models.Index(fields=['tag', 'name'], name='main_entity_tag_name'),
+        ),
+        migrations.AddIndex(
+            model_name='stage',
+            index=models.Index(fields=['project', 'genus', 'name'], name='main_stage_project_genus_name'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['project', 'genus', 'name'], name='main_tag_project_genus_name'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['entity', 'stage'], name='main_task_entity_stage'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:07
+
+from django.db import migrations
+from django.db.models import Count, F
+
+
+def remove_duplicate_tasks(apps, schema_editor):
+    """Keep one task per (entity, stage), an owned one when there is one."""
+    Task = apps.get_model('main', 'Task')
+    pairs = Task.objects.order_by().values('entity', 'stage').annotate(count=Count('id')).filter(count__gt=1)
+    for pair in pairs:
+        tasks = Task.objects.filter(entity=pair['entity'], stage=pair['stage'])
+        ids = list(tasks.order_by(F('owner').asc(nulls_last=True), 'id').values_list('id', flat=True))
+        Task.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_tasks, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='task',
+            unique_together={('entity', 'stage')},
+        ),
+        # The unique index serves the same lookups.
+        migrations.RemoveIndex(
+            model_name='task',
+            name='main_task_entity_stage',
+        ),
+    ]
@@ -3,12 +3,19 @@ from __future__ import unicode_literals
 
 import json
 import uuid
+import base64
+from functools import reduce
+from itertools import islice
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Q
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.models import User
 from django.utils.encoding import python_2_unicode_compatible
 
+from main.signals import bulk_changed, owner_changed
+
 
 __all__ = [
     'User',
@@ -23,6 +30,109 @@ __all__ = [
 ]
 
 
+# Default tags and stages of a new project, override with settings.PROJECT_TEMPLATE.
+PROJECT_TEMPLATE = {
+    'tags': [
+        {'genus': 'batch', 'name': 'EP', 'info': u'集数'},
+        {'genus': 'asset', 'name': 'CH', 'info': u'角色'},
+        {'genus': 'asset', 'name': 'Prop', 'info': u'道具'},
+        {'genus': 'asset', 'name': 'SC', 'info': u'场景'},
+    ],
+    'stages': [
+        {
+            'genus': 'asset',
+            'name': 'mdl',
+            'info': u'模型',
+            'source': '{project}/{genus}/{tag}/{entity}/{entity}_{stage}.ma',
+            'data': '{project}/{genus}/{tag}/{entity}/',
+        },
+        {
+            'genus': 'asset',
+            'name': 'rig',
+            'info': u'绑定',
+            'source': '{project}/{genus}/{tag}/{entity}/{entity}_{stage}.ma',
+            'data': '{project}/{genus}/{tag}/{entity}/',
+        },
+        {
+            'genus': 'shot',
+            'name': 'lyt',
+            'info': u'布局',
+            'source': '{project}/{genus}/source/{project}_{tag}_{entity}_layout.ma',
+            'data': '{project}/{genus}/{tag}/{entity}/',
+        },
+        {
+            'genus': 'shot',
+            'name': 'anm',
+            'info': u'动画',
+            'source': '{project}/{genus}/source/{project}_{tag}_{entity}.ma',
+            'data': '{project}/{genus}/{tag}/{entity}/',
+        },
+    ],
+}
+
+
+def _listing_options(kwargs):
+    """Pop the fields/limit/after listing options out of the API filters.
+
+    Raises ValueError for a limit that is not an integer, a cursor not made by _paginate
+    or a cursor without a limit.
+    """
+    fields = kwargs.pop('fields', None)
+    limit = kwargs.pop('limit', None)
+    after = kwargs.pop('after', None)
+    try:
+        limit = max(int(limit), 1) if limit else None
+    except ValueError:
+        raise ValueError('Invalid limit %s' % limit)
+    if after and not limit:
+        raise ValueError('A cursor needs a limit')
+    return set(fields.split(',')) if fields else None, limit, _decode_cursor(after) if after else None
+
+
+def _decode_cursor(after):
+    try:
+        last_name, last_id = json.loads(base64.urlsafe_b64decode(str(after)).decode('utf-8'))
+        return last_name, uuid.UUID(last_id)
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError('Invalid cursor %s' % after)
+
+
+def _paginate(queryset, name, limit, after):
+    """Keyset pagination ordered by (name, id), returns the page rows and the cursor of the next page."""
+    if not limit:
+        return queryset, None
+
+    queryset = queryset.order_by(name, 'id')
+    if after:
+        last_name, last_id = after
+        queryset = queryset.filter(Q(**{name + '__gt': last_name}) | Q(**{name: last_name, 'id__gt': last_id}))
+
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+
+    last = rows[limit - 1]
+    if not isinstance(last, dict):
+        last = {name: reduce(getattr, name.split('__'), last), 'id': last.id}
+    cursor = json.dumps([last[name], str(last['id'])])
+    return rows[:limit], base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+
+
+def _project(row, fields):
+    return {k: v for k, v in row.items() if k in fields} if fields else row
+
+
+def _listing(result, fields, limit, cursor):
+    result = [_project(row, fields) for row in result]
+    return {'results': result, 'next': cursor} if limit else result
+
+
+class _TemplateFields(dict):
+    # Keeps unknown placeholders intact so a template can be formatted in several passes.
+    def __missing__(self, key):
+        return '{%s}' % key
+
+
 @python_2_unicode_compatible
 class Role(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -87,71 +197,34 @@ class Project(models.Model):
         prj.save()
 
     def save(self, *args, **kwargs):
-        is_edit = len(Project.objects.filter(id=self.id))
-        super(Project, self).save(*args, **kwargs)
-
-        if is_edit:
-            return
-
-        gns_asset = Genus.objects.get(name='asset')
-        gns_shot = Genus.objects.get(name='shot')
-        gns_batch = Genus.objects.get(name='batch')
-        Tag(
-            project=self,
-            genus=gns_batch,
-            name='EP',
-            info=u'集数'
-        ).save()
-        Tag(
-            project=self,
-            genus=gns_asset,
-            name='CH',
-            info=u'角色'
-        ).save()
-        Tag(
-            project=self,
-            genus=gns_asset,
-            name='Prop',
-            info=u'道具'
-        ).save()
-        Tag(
-            project=self,
-            genus=gns_asset,
-            name='SC',
-            info=u'场景'
-        ).save()
-        Stage(
-            project=self,
-            genus=gns_asset,
-            name='mdl',
-            info=u'模型',
-            source='{project}/{genus}/{tag}/{entity}/{entity}_{stage}.ma',
-            data='{project}/{genus}/{tag}/{entity}/',
-        ).save()
-        Stage(
-            project=self,
-            genus=gns_asset,
-            name='rig',
-            info=u'绑定',
-            source='{project}/{genus}/{tag}/{entity}/{entity}_{stage}.ma',
-            data='{project}/{genus}/{tag}/{entity}/',
-        ).save()
-        Stage(
-            project=self,
-            genus=gns_shot,
-            name='lyt',
-            info=u'布局',
-            source='{project}/{genus}/source/{project}_{tag}_{entity}_layout.ma',
-            data='{project}/{genus}/{tag}/{entity}/',
-        ).save()
-        Stage(
-            project=self,
-            genus=gns_shot,
-            name='anm',
-            info=u'动画',
-            source='{project}/{genus}/source/{project}_{tag}_{entity}.ma',
-            data='{project}/{genus}/{tag}/{entity}/',
-        ).save()
+        is_edit = Project.objects.filter(id=self.id).exists()
+        with transaction.atomic():
+            super(Project, self).save(*args, **kwargs)
+            if not is_edit:
+                self.apply_template()
+
+    def apply_template(self, template=None):
+        """Create the default tags and stages of a new project, see PROJECT_TEMPLATE."""
+        template = template or getattr(settings, 'PROJECT_TEMPLATE', PROJECT_TEMPLATE)
+        names = {row['genus'] for row in template['tags'] + template['stages']}
+        genera = {gns.name: gns for gns in Genus.objects.filter(name__in=names)}
+        Tag.objects.bulk_create([
+            Tag(project=self, genus=genera[row['genus']], name=row['name'], info=row['info'])
+            for row in template['tags']
+        ])
+        Stage.objects.bulk_create([
+            Stage(
+                project=self,
+                genus=genera[row['genus']],
+                name=row['name'],
+                info=row['info'],
+                source=row['source'],
+                data=row['data'],
+            )
+            for row in template['stages']
+        ])
+        bulk_changed.send(sender=Tag)
+        bulk_changed.send(sender=Stage)
     
     def __str__(self):
         return self.name
@@ -161,7 +234,7 @@ class Project(models.Model):
 class Genus(models.Model):
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    name = models.CharField(max_length=10)
+    name = models.CharField(max_length=10, db_index=True)
     info = models.CharField(max_length=50, blank=True)
     
     def __str__(self):
@@ -195,6 +268,9 @@ class Tag(models.Model):
     name = models.CharField(max_length=50)
     info = models.CharField(max_length=50, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['project', 'genus', 'name'], name='main_tag_project_genus_name')]
+
     @classmethod
     def get(cls, **kwargs):
         result = []
@@ -242,6 +318,34 @@ class Tag(models.Model):
             )
         tag.save()
     
+    @classmethod
+    def mirror_batches(cls, entities):
+        """Bulk version of the shot tag bookkeeping in Entity.save for batch entities."""
+        batches = [ent for ent in entities if ent.tag.genus.name == 'batch']
+        if not batches:
+            return
+
+        existing = {}
+        for tag in cls.objects.filter(
+            project__in={ent.tag.project_id for ent in batches},
+            name__in={ent.name for ent in batches},
+        ):
+            existing.setdefault((tag.project_id, tag.name), tag)
+
+        genus = Genus.objects.get(name='shot')
+        created, updated = [], []
+        for ent in batches:
+            tag = existing.get((ent.tag.project_id, ent.name))
+            if tag is None:
+                tag = cls(project=ent.tag.project, genus=genus, name=ent.name, info=ent.info)
+                existing[(ent.tag.project_id, ent.name)] = tag
+                created.append(tag)
+            else:
+                tag.info = ent.info
+                updated.append(tag)
+        cls.objects.bulk_create(created)
+        cls.objects.bulk_update(updated, ['info'])
+
     def __str__(self):
         return self.name if self.project.name == '|' else '%s | %s' % (self.project, self.name)
 
@@ -256,9 +360,11 @@ class Entity(models.Model):
     info = models.CharField(max_length=200, blank=True)
     thumb = models.ImageField(upload_to="thumbs", default="thumbs/default.png")
 
+    class Meta:
+        indexes = [models.Index(fields=['tag', 'name'], name='main_entity_tag_name')]
+
     @classmethod
-    def get(cls, **kwargs):
-        result = []
+    def lookup(cls, **kwargs):
         keywords = {}
         mapper = {
             'project_id': 'tag__project__id',
@@ -272,35 +378,90 @@ class Entity(models.Model):
                 keywords[mapper[key]] = uuid.UUID(kwargs[key]) if key in ['project_id'] else kwargs[key]
             else:
                 keywords[key] = uuid.UUID(kwargs[key]) if key == 'id' else kwargs[key]
-        for ent in cls.objects.filter(**keywords):
-            link = []
-            for l in ent.link.all():
-                link.append(str(l.id))
+        return keywords
 
-            result.append({
-                'id': str(ent.id),
-                'name': ent.name,
-                'info': ent.info,
-                'genus_id': str(ent.tag.genus.id),
-                'genus_name': ent.tag.genus.name,
-                'genus_info': ent.tag.genus.info,
-                'tag_id': str(ent.tag.id),
-                'tag_name': ent.tag.name,
-                'tag_info': ent.tag.info,
-                'link': link,
-                'thumb': ent.thumb.url,
-            })
-        return result
+    @classmethod
+    def get(cls, **kwargs):
+        fields, limit, after = _listing_options(kwargs)
+        with_link = not fields or 'link' in fields
+        queryset = cls.prefetched(link=with_link).filter(**cls.lookup(**kwargs))
+        rows, cursor = _paginate(queryset, 'name', limit, after)
+        result = []
+        for ent in rows:
+            result.append(ent.serialize([str(l.id) for l in ent.link.all()] if with_link else []))
+        return _listing(result, fields, limit, cursor)
+
+    @classmethod
+    def stream(cls, chunk_size=500, **kwargs):
+        """Return a generator of serialized entities holding at most one chunk of rows in memory.
+
+        The filters are checked right away, only the rows are read lazily.
+        """
+        fields, _, _ = _listing_options(kwargs)
+        rows = cls.prefetched(link=False).filter(**cls.lookup(**kwargs)).iterator(chunk_size=chunk_size)
+        return cls.stream_chunks(rows, chunk_size, fields)
+
+    @classmethod
+    def stream_chunks(cls, rows, chunk_size, fields):
+        with_link = not fields or 'link' in fields
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            # prefetch_related is ignored by iterator(), so links come from the through table per chunk
+            links = {}
+            if with_link:
+                through = cls.link.through.objects.filter(from_entity__in=[ent.id for ent in chunk])
+                for from_id, to_id in through.values_list('from_entity_id', 'to_entity_id'):
+                    links.setdefault(from_id, []).append(str(to_id))
+            for ent in chunk:
+                yield _project(ent.serialize(links.get(ent.id, [])), fields)
+
+    def serialize(self, link):
+        return {
+            'id': str(self.id),
+            'name': self.name,
+            'info': self.info,
+            'genus_id': str(self.tag.genus.id),
+            'genus_name': self.tag.genus.name,
+            'genus_info': self.tag.genus.info,
+            'tag_id': str(self.tag.id),
+            'tag_name': self.tag.name,
+            'tag_info': self.tag.info,
+            'link': link,
+            'thumb': self.thumb.url,
+        }
+
+    @classmethod
+    def prefetched(cls, link=True):
+        # Resolve tag/genus/project with joins and all links with one extra query,
+        # so serializing a listing costs the same number of queries for any row count.
+        queryset = cls.objects.select_related('tag__genus', 'tag__project')
+        if link:
+            queryset = queryset.prefetch_related(models.Prefetch('link', queryset=cls.objects.only('id')))
+        return queryset
 
     @classmethod
     def get_by_id(cls, id_list):
-        result = []
+        """Serialize entities in the order of the given JSON id list.
+
+        Unknown or malformed ids are reported in place as {'id': ..., 'missing': True}.
+        """
         id_list = json.loads(id_list)
+        keys = []
         for i in id_list:
-            link = []
-            ent = cls.objects.get(id=i)
-            for l in ent.link.all():
-                link.append(str(l.id))
+            try:
+                keys.append(uuid.UUID(str(i)))
+            except ValueError:
+                keys.append(None)
+
+        entities = cls.prefetched().in_bulk([k for k in keys if k])
+        result = []
+        for i, key in zip(id_list, keys):
+            ent = entities.get(key)
+            if ent is None:
+                result.append({'id': str(i), 'missing': True})
+                continue
             result.append({
                 'id': str(ent.id),
                 'project': ent.tag.project.name,
@@ -310,7 +471,7 @@ class Entity(models.Model):
                 'genus_info': ent.tag.genus.info,
                 'tag': ent.tag.name,
                 'tag_info': ent.tag.info,
-                'link': link,
+                'link': [str(l.id) for l in ent.link.all()],
                 'thumb': ent.thumb.url,
             })
         return result
@@ -350,6 +511,66 @@ class Entity(models.Model):
 
         ent.save()
     
+    @classmethod
+    def bulk_set(cls, rows):
+        """Create or update entities in one transaction and return their ids in input order.
+
+        Rows are dicts with tag_id, name, info and optionally id and link. Saved entities get
+        their missing tasks and, for batches, the mirrored shot tag just like Entity.save.
+        Raises ValueError for a malformed row or an unknown tag, entity or link id.
+        """
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError('Expected a list of entity objects')
+        tags = Tag.objects.select_related('genus', 'project').in_bulk(
+            {uuid.UUID(str(row['tag_id'])) for row in rows}
+        )
+        existing = cls.objects.in_bulk([uuid.UUID(str(row['id'])) for row in rows if row.get('id')])
+
+        result, created, updated, links, projects = [], [], [], {}, set()
+        for row in rows:
+            tag = tags.get(uuid.UUID(str(row['tag_id'])))
+            if tag is None:
+                raise ValueError('Unknown tag %s' % row['tag_id'])
+            projects.add(tag.project_id)
+            if row.get('id'):
+                ent = existing.get(uuid.UUID(str(row['id'])))
+                if ent is None:
+                    raise ValueError('Unknown entity %s' % row['id'])
+                ent.tag, ent.name, ent.info = tag, row['name'], row.get('info', '')
+                updated.append(ent)
+            else:
+                ent = cls(tag=tag, name=row['name'], info=row.get('info', ''))
+                created.append(ent)
+            if 'link' in row or not row.get('id'):
+                if not isinstance(row.get('link', []), list):
+                    raise ValueError('Expected a list of links for %s' % row['name'])
+                links[ent.id] = [uuid.UUID(str(i)) for i in row.get('link', [])]
+            result.append(str(ent.id))
+
+        link_ids = {link_id for link_ids in links.values() for link_id in link_ids}
+        missing = link_ids - set(cls.objects.filter(id__in=link_ids).values_list('id', flat=True))
+        if missing:
+            raise ValueError('Unknown link %s' % ', '.join(sorted(str(i) for i in missing)))
+
+        through = cls.link.through
+        with transaction.atomic():
+            cls.objects.bulk_create(created)
+            cls.objects.bulk_update(updated, ['tag', 'name', 'info'])
+            through.objects.filter(from_entity__in=[ent.id for ent in updated if ent.id in links]).delete()
+            through.objects.bulk_create([
+                through(from_entity_id=ent_id, to_entity_id=link_id)
+                for ent_id, link_ids in links.items() for link_id in link_ids
+            ])
+            Tag.mirror_batches(created + updated)
+
+            # An update may have moved an entity to a tag of another genus.
+            if created or updated:
+                Task.setup(entities=created + updated)
+
+        bulk_changed.send(sender=Entity, projects=projects)
+        bulk_changed.send(sender=Tag)
+        return result
+
     def genus(self):
         return self.tag.genus
     
@@ -372,16 +593,7 @@ class Entity(models.Model):
                 tag.save()
 
         super(Entity, self).save(*args, **kwargs)
-
-        if Task.objects.filter(entity=self):
-            return
-
-        for stage in Stage.objects.filter(genus=self.genus(), project=project):
-            data = {
-                'entity': self,
-                'stage': stage,
-            }
-            Task(**data).save()
+        Task.setup(entities=[self])
         
     def delete(self, using=None, keep_parents=False):
         if self.genus().name == 'batch':
@@ -450,6 +662,13 @@ class Stage(models.Model):
     source = models.CharField(max_length=200, default='/')
     data = models.CharField(max_length=200, default='/')
 
+    class Meta:
+        indexes = [models.Index(fields=['project', 'genus', 'name'], name='main_stage_project_genus_name')]
+
+    def save(self, *args, **kwargs):
+        super(Stage, self).save(*args, **kwargs)
+        Task.setup(stages=[self])
+
     def __str__(self):
         return self.name
     
@@ -462,13 +681,25 @@ class Task(models.Model):
     stage = models.ForeignKey(Stage, default=uuid.uuid4, on_delete=models.CASCADE)
     owner = models.ForeignKey(User, blank=True, null=True, on_delete=models.SET_NULL)
 
+    class Meta:
+        # One task per pair, also serving the (entity, stage) lookups. owner is covered
+        # by the index of its foreign key.
+        unique_together = [('entity', 'stage')]
+
+    COLUMNS = (
+        'id', 'stage_id', 'owner__username',
+        'stage__name', 'stage__info', 'stage__source', 'stage__data',
+        'stage__project__name', 'stage__project__root',
+        'stage__genus__name', 'stage__genus__info',
+        'entity__name', 'entity__info', 'entity__tag__name', 'entity__tag__info',
+    )
+
     @classmethod
-    def get(cls, **kwargs):
-        result = []
+    def lookup(cls, **kwargs):
         keywords = {}
         mapper = {
             'project': 'stage__project__name',
-            'genus': 'genus__name',
+            'genus': 'stage__genus__name',
             'stage': 'stage__name',
             'entity': 'entity__name',
             'entity_id': 'entity__id',
@@ -479,34 +710,75 @@ class Task(models.Model):
                 keywords[mapper[key]] = uuid.UUID(kwargs[key]) if key in ['entity_id'] else kwargs[key]
             else:
                 keywords[key] = uuid.UUID(kwargs[key]) if key == 'id' else kwargs[key]
+        return keywords
 
-        for tsk in cls.objects.filter(**keywords):
-            result.append({
-                'id': str(tsk.id),
-                'project': tsk.stage.project.name,
-                'genus': tsk.stage.genus.name,
-                'genus_info': tsk.stage.genus.info,
-                'tag': tsk.entity.tag.name,
-                'tag_info': tsk.entity.tag.info,
-                'entity': tsk.entity.name,
-                'entity_info': tsk.entity.info,
-                'stage': tsk.stage.name,
-                'stage_info': tsk.stage.info,
-                'path': tsk.path(),
-                'owner': str(tsk.owner.username if tsk.owner else ''),
-            })
-        return result
+    @classmethod
+    def get(cls, **kwargs):
+        fields, limit, after = _listing_options(kwargs)
+        queryset = cls.objects.filter(**cls.lookup(**kwargs)).values(*cls.COLUMNS)
+        rows, cursor = _paginate(queryset, 'entity__name', limit, after)
+        return _listing(list(cls.serialize(rows)), fields, limit, cursor)
+
+    @classmethod
+    def stream(cls, chunk_size=500, **kwargs):
+        """Return a generator of serialized tasks holding at most one chunk of rows in memory.
+
+        The filters are checked right away, only the rows are read lazily.
+        """
+        fields, _, _ = _listing_options(kwargs)
+        queryset = cls.objects.filter(**cls.lookup(**kwargs)).values(*cls.COLUMNS)
+        return (_project(row, fields) for row in cls.serialize(queryset.iterator(chunk_size=chunk_size)))
+
+    @classmethod
+    def serialize(cls, rows):
+        """Serialize Task.COLUMNS value rows, formatting path templates once per stage."""
+        templates = {}
+        for row in rows:
+            if row['stage_id'] not in templates:
+                templates[row['stage_id']] = cls.path_templates(
+                    row['stage__source'],
+                    row['stage__data'],
+                    root=row['stage__project__root'],
+                    project=row['stage__project__name'],
+                    genus=row['stage__genus__name'],
+                    stage=row['stage__name'],
+                )
+            path = [t.format(tag=row['entity__tag__name'], entity=row['entity__name'])
+                    for t in templates[row['stage_id']]]
+            yield {
+                'id': str(row['id']),
+                'project': row['stage__project__name'],
+                'genus': row['stage__genus__name'],
+                'genus_info': row['stage__genus__info'],
+                'tag': row['entity__tag__name'],
+                'tag_info': row['entity__tag__info'],
+                'entity': row['entity__name'],
+                'entity_info': row['entity__info'],
+                'stage': row['stage__name'],
+                'stage_info': row['stage__info'],
+                'path': ';'.join(path),
+                'owner': row['owner__username'] or '',
+            }
+
+    @staticmethod
+    def path_templates(*templates, **fields):
+        """Fill the stage level fields of path templates, leaving {tag} and {entity} in place."""
+        return tuple(t.format_map(_TemplateFields(fields)) for t in templates)
 
     def path(self):
-        root = self.stage.project.root
-        project = self.stage.project.name
+        source, data = self.path_templates(
+            self.stage.source,
+            self.stage.data,
+            root=self.stage.project.root,
+            project=self.stage.project.name,
+            genus=self.stage.genus.name,
+            stage=self.stage.name,
+        )
         tag = self.entity.tag.name
-        genus = self.stage.genus.name
         entity = self.entity.name
-        stage = self.stage.name
         return ';'.join((
-            self.stage.source.format(**locals()),
-            self.stage.data.format(**locals())
+            source.format(tag=tag, entity=entity),
+            data.format(tag=tag, entity=entity),
         ))
 
     @classmethod
@@ -529,8 +801,53 @@ class Task(models.Model):
         tsk.save()
 
     @classmethod
-    def setup(cls, entity, stage=None):
-        project = entity.tag.project
+    def checkout(cls, task_id, user):
+        """Give a free task to user, in a single conditional UPDATE so two clients can't both win."""
+        updated = cls.objects.filter(id=task_id, owner__isnull=True).update(owner=user)
+        if updated:
+            bulk_changed.send(sender=cls)
+            owner_changed.send(sender=cls, task_id=task_id, owner=user)
+        return bool(updated)
+
+    @classmethod
+    def release(cls, task_id, user):
+        """Free a task, only while user still owns it."""
+        updated = cls.objects.filter(id=task_id, owner=user).update(owner=None)
+        if updated:
+            bulk_changed.send(sender=cls)
+            owner_changed.send(sender=cls, task_id=task_id, owner=None)
+        return bool(updated)
+
+    @classmethod
+    def setup(cls, entities=None, stages=None, project=None):
+        """Create the missing task of every (entity, stage) pair sharing a project and genus.
+
+        The missing pairs come from a single anti-join, optionally narrowed down to some
+        entities, stages or a project, and are inserted with one bulk_create. Pairs another
+        process inserted since the anti-join hit the (entity, stage) unique constraint and
+        are skipped.
+        """
+        # Stage conditions must share one filter() call to stay on the same join.
+        keywords = {'tag__project__stage__genus': models.F('tag__genus')}
+        if entities is not None:
+            keywords['id__in'] = [ent.id for ent in entities]
+        if stages is not None:
+            keywords['tag__project__stage__in'] = [stg.id for stg in stages]
+        if project is not None:
+            keywords['tag__project'] = project
+        pairs = Entity.objects.filter(**keywords).annotate(
+            has_task=models.Exists(cls.objects.filter(entity=models.OuterRef('id'),
+                                                      stage=models.OuterRef('tag__project__stage')))
+        ).filter(has_task=False).values_list('id', 'tag__project__stage', 'tag__project')
+
+        tasks, projects = [], set()
+        for ent_id, stg_id, prj_id in pairs:
+            tasks.append(cls(entity_id=ent_id, stage_id=stg_id))
+            projects.add(prj_id)
+        if tasks:
+            cls.objects.bulk_create(tasks, ignore_conflicts=True)
+            bulk_changed.send(sender=cls, projects=projects)
+        return len(tasks)
     
     def __str__(self):
         return '%s - %s' % (self.stage.name, self.entity)
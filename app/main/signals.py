@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.dispatch import Signal
+
+
+# Sent with the model class as sender after rows were written in bulk,
+# since bulk_create/bulk_update/QuerySet.update bypass post_save. Writers of
+# entities and tasks also pass projects, the ids of the projects they touched.
+bulk_changed = Signal(providing_args=['projects'])
+
+# Sent with the Task class as sender and task_id/owner after Task.checkout or Task.release
+# changed an owner with QuerySet.update.
+owner_changed = Signal(providing_args=['task_id', 'owner'])
@@ -1,6 +1,646 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.test import TestCase
+import os
+import json
+import uuid
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+import main
+from host import routing
+from main import cache, db, models, views
+
+
+class SetupMixin(object):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('asset', 'shot', 'batch'):
+            models.Genus(name=name, info=name).save()
+        cls.project = models.Project(name='TST', info='test')
+        cls.project.save()
+        cls.tag = models.Tag.objects.get(project=cls.project, name='CH')
+
+    def setUp(self):
+        cache.backend().clear()
+        cache.counters.clear()
+
+    def add_entities(self, count, tag=None):
+        tag = tag or self.tag
+        start = models.Entity.objects.filter(tag=tag).count()
+        entities = []
+        for i in range(start, start + count):
+            ent = models.Entity(tag=tag, name='ent%03d' % i, info='entity %d' % i)
+            ent.save()
+            entities.append(ent)
+        return entities
+
+    def count_queries(self, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            func(*args, **kwargs)
+        return len(context)
+
+
+class ProjectTest(SetupMixin, TestCase):
+
+    def test_new_project_is_bootstrapped_in_bulk(self):
+        project = models.Project(name='NEW')
+        with CaptureQueriesContext(connection) as context:
+            project.save()
+        inserts = [q['sql'] for q in context.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(models.Tag.objects.filter(project=project).count(), 4)
+        self.assertEqual(models.Stage.objects.filter(project=project).count(), 4)
+
+        project.info = 'edited'
+        project.save()
+        self.assertEqual(models.Tag.objects.filter(project=project).count(), 4)
+
+    def test_template_comes_from_settings(self):
+        template = {
+            'tags': [{'genus': 'asset', 'name': 'FX', 'info': 'effects'}],
+            'stages': [],
+        }
+        with self.settings(PROJECT_TEMPLATE=template):
+            project = models.Project(name='FX')
+            project.save()
+        self.assertEqual([tag.name for tag in models.Tag.objects.filter(project=project)], ['FX'])
+
+
+class EntityTest(SetupMixin, TestCase):
+
+    def test_get_query_count_is_flat(self):
+        first, second = self.add_entities(2)
+        first.link.add(second)
+        small = self.count_queries(models.Entity.get, tag_id=str(self.tag.id))
+
+        self.add_entities(20)
+        large = self.count_queries(models.Entity.get, tag_id=str(self.tag.id))
+        self.assertEqual(small, large)
+
+    def test_get_serializes_links(self):
+        first, second = self.add_entities(2)
+        first.link.add(second)
+        result = {ent['name']: ent for ent in models.Entity.get(tag_id=str(self.tag.id))}
+        self.assertEqual(result['ent000']['link'], [str(second.id)])
+        self.assertEqual(result['ent000']['tag_name'], 'CH')
+        self.assertEqual(result['ent000']['genus_name'], 'asset')
+
+    def test_get_by_id_keeps_order_and_reports_missing(self):
+        entities = self.add_entities(4)
+        ids = [str(entities[2].id), 'bogus', str(entities[0].id), str(uuid.uuid4())]
+        with self.assertNumQueries(2):
+            result = models.Entity.get_by_id(json.dumps(ids))
+        self.assertEqual([ent['id'] for ent in result], ids)
+        self.assertEqual(result[0]['name'], 'ent002')
+        self.assertEqual(result[2]['project'], 'TST')
+        self.assertTrue(result[1]['missing'])
+        self.assertTrue(result[3]['missing'])
+
+    def test_get_pages_by_cursor(self):
+        self.add_entities(25)
+        names, after = [], None
+        while True:
+            page = models.Entity.get(tag_id=str(self.tag.id), limit='10', **({'after': after} if after else {}))
+            names += [ent['name'] for ent in page['results']]
+            after = page['next']
+            if not after:
+                break
+        self.assertEqual(names, ['ent%03d' % i for i in range(25)])
+
+    def test_bad_listing_options_are_rejected(self):
+        for options in ({'limit': 'ten'}, {'limit': '10', 'after': 'garbage'}, {'limit': '10', 'after': 'WzFd'},
+                        {'limit': 'ten', 'stream': '1'}, {'stream': 'yes'}):
+            response = self.client.get('/api/entity', dict(options, tag_id=str(self.tag.id)))
+            self.assertEqual(response.status_code, 400, options)
+
+    def test_cursor_without_limit_is_rejected(self):
+        self.add_entities(2)
+        after = models.Entity.get(tag_id=str(self.tag.id), limit='1')['next']
+        response = self.client.get('/api/entity', {'tag_id': str(self.tag.id), 'after': after})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_projects_fields(self):
+        self.add_entities(3)
+        with self.assertNumQueries(1):
+            result = models.Entity.get(tag_id=str(self.tag.id), fields='id,name,info')
+        self.assertEqual(set(result[0]), {'id', 'name', 'info'})
+
+    def test_bulk_set_creates_tasks_links_and_shot_tags(self):
+        existing = self.add_entities(1)[0]
+        batch = models.Tag.objects.get(project=self.project, name='EP')
+        rows = [
+            {'tag_id': str(self.tag.id), 'name': 'hero', 'info': 'Hero', 'link': [str(existing.id)]},
+            {'tag_id': str(batch.id), 'name': 'EP01', 'info': 'Episode 1'},
+            {'id': str(existing.id), 'tag_id': str(self.tag.id), 'name': 'renamed', 'info': 'Renamed'},
+        ]
+        listing = {'tag_id': str(self.tag.id)}
+        self.assertEqual(len(json.loads(self.client.get('/api/entity', listing).content.decode())), 1)
+        response = self.client.post('/api/entity/bulk', json.dumps(rows), content_type='application/json')
+        ids = json.loads(response.content.decode())['ids']
+        self.assertEqual(len(json.loads(self.client.get('/api/entity', listing).content.decode())), 2)
+        self.assertEqual(ids[2], str(existing.id))
+
+        hero = models.Entity.objects.get(id=ids[0])
+        self.assertEqual([str(ent.id) for ent in hero.link.all()], [str(existing.id)])
+        self.assertEqual(models.Task.objects.filter(entity=hero).count(), 2)
+        self.assertEqual(models.Entity.objects.get(id=existing.id).name, 'renamed')
+        shot = models.Tag.objects.get(project=self.project, name='EP01')
+        self.assertEqual((shot.genus.name, shot.info), ('shot', 'Episode 1'))
+
+    def test_bulk_set_rejects_unknown_tag(self):
+        rows = [{'tag_id': str(uuid.uuid4()), 'name': 'ghost', 'info': ''}]
+        response = self.client.post('/api/entity/bulk', json.dumps(rows), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.Entity.objects.filter(name='ghost').exists())
+
+    def test_bulk_set_rejects_unknown_links_and_bad_rows(self):
+        row = {'tag_id': str(self.tag.id), 'name': 'ghost', 'info': ''}
+        for rows in ([dict(row, link=[str(uuid.uuid4())])], [dict(row, link='abc')], ['ghost'], [[]], row, 5):
+            response = self.client.post('/api/entity/bulk', json.dumps(rows), content_type='application/json')
+            self.assertEqual(response.status_code, 400, rows)
+        self.assertFalse(models.Entity.objects.filter(name='ghost').exists())
+
+    def test_bulk_set_gives_moved_entities_their_tasks(self):
+        entity = self.add_entities(1)[0]
+        shot = models.Tag.objects.create(project=self.project, genus=models.Genus.objects.get(name='shot'), name='EP01')
+        rows = [{'id': str(entity.id), 'tag_id': str(shot.id), 'name': entity.name, 'info': ''}]
+        self.client.post('/api/entity/bulk', json.dumps(rows), content_type='application/json')
+        stages = models.Task.objects.filter(entity=entity).values_list('stage__name', flat=True)
+        self.assertEqual(sorted(stages), ['anm', 'lyt', 'mdl', 'rig'])
+
+
+class TaskTest(SetupMixin, TestCase):
+
+    def test_new_stage_fans_out_to_existing_entities(self):
+        entities = self.add_entities(3)
+        genus = models.Genus.objects.get(name='asset')
+        stage = models.Stage(project=self.project, genus=genus, name='srf', info='surfacing')
+        with CaptureQueriesContext(connection) as context:
+            stage.save()
+        self.assertLessEqual(len(context), 4)
+        self.assertEqual(models.Task.objects.filter(stage=stage).count(), 3)
+        self.assertEqual(models.Task.objects.filter(entity=entities[0]).count(), 3)
+
+    def test_setup_skips_pairs_inserted_concurrently(self):
+        entity = self.add_entities(1)[0]
+        tasks = models.Task.objects.filter(entity=entity)
+        stage = tasks.first().stage
+        tasks.delete()
+        bulk_create = models.Task.objects.bulk_create
+
+        def concurrent(*args, **kwargs):
+            # Another process inserts one of the pairs between the anti-join and the insert.
+            models.Task.objects.create(entity=entity, stage=stage)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(models.Task.objects, 'bulk_create', side_effect=concurrent):
+            models.Task.setup(entities=[entity])
+        self.assertEqual(sorted(tasks.values_list('stage__name', flat=True)), ['mdl', 'rig'])
+
+    def test_sync_tasks_command_reconciles_project(self):
+        entities = self.add_entities(2)
+        models.Task.objects.filter(entity=entities[0]).delete()
+        out = StringIO()
+        call_command('sync_tasks', 'TST', stdout=out)
+        self.assertIn('TST: 2 task(s) created', out.getvalue())
+        self.assertEqual(models.Task.objects.filter(entity=entities[0]).count(), 2)
+        self.assertEqual(models.Task.setup(project=self.project), 0)
+
+    def test_checkout_is_exclusive(self):
+        task = models.Task.objects.get(entity=self.add_entities(1)[0], stage__name='mdl')
+        alice = User.objects.create_user('alice', password='alice')
+        User.objects.create_user('bob', password='bob')
+
+        self.client.login(username='alice', password='alice')
+        response = self.client.post('/api/task/checkout', {'id': task.id})
+        self.assertEqual(json.loads(response.content.decode()), {'success': True, 'owner': 'alice'})
+
+        self.client.login(username='bob', password='bob')
+        response = self.client.post('/api/task/checkout', {'id': task.id})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content.decode()), {'success': False, 'owner': 'alice'})
+        self.assertEqual(self.client.post('/api/task/release', {'id': task.id}).status_code, 409)
+        self.assertEqual(models.Task.objects.get(id=task.id).owner, alice)
+
+        self.client.login(username='alice', password='alice')
+        response = self.client.post('/api/task/release', {'id': task.id})
+        self.assertEqual(json.loads(response.content.decode()), {'success': True, 'owner': None})
+        self.assertIsNone(models.Task.objects.get(id=task.id).owner)
+
+    def test_checkout_requires_login(self):
+        task = models.Task.objects.get(entity=self.add_entities(1)[0], stage__name='mdl')
+        self.assertEqual(self.client.post('/api/task/checkout', {'id': task.id}).status_code, 403)
+        self.client.force_login(User.objects.create_user('alice'))
+        self.assertEqual(self.client.post('/api/task/checkout', {'id': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.post('/api/task/checkout', {'id': uuid.uuid4()}).status_code, 404)
+        self.assertEqual(self.client.post('/api/task/release', {'id': uuid.uuid4()}).status_code, 404)
+
+    def test_api_routes_by_full_path(self):
+        entity = self.add_entities(1)[0]
+        self.client.force_login(User.objects.create_user('alice'))
+        self.assertEqual(self.client.post('/api/entity/checkout', {'id': entity.id}).status_code, 404)
+        self.assertEqual(self.client.get('/api/task/checkout').status_code, 405)
+        self.assertEqual(self.client.get('/api/entity/bulk').status_code, 405)
+        self.assertEqual(self.client.post('/api/genus', {}).status_code, 405)
+        self.assertEqual(self.client.get('/api/nothing').status_code, 404)
+        self.assertEqual(self.client.get('/api/task/bulk').status_code, 404)
+
+    def test_lookups_use_indexes(self):
+        out = StringIO()
+        call_command('query_plans', seed=30, repeat=1, stdout=out)
+        without, with_indexes = out.getvalue().split('== with indexes')
+        with connection.cursor() as cursor:
+            unique = [name for name, info in connection.introspection.get_constraints(cursor, 'main_task').items()
+                      if info['unique'] and info['columns'] == ['entity_id', 'stage_id']]
+        self.assertEqual(len(unique), 1)
+        for index in ('main_tag_project_genus_name', 'main_entity_tag_name',
+                      'main_stage_project_genus_name', unique[0]):
+            self.assertNotIn(index, without)
+            self.assertIn(index, with_indexes)
+        self.assertTrue(models.Genus.objects.filter(name='asset').exists())
+        self.assertFalse(models.Project.objects.filter(name='query_plans').exists())
+
+    def test_get_is_single_query(self):
+        self.add_entities(5)
+        self.assertEqual(self.count_queries(models.Task.get, project='TST'), 1)
+
+    def test_get_path_matches_model(self):
+        self.add_entities(3)
+        result = {tsk['id']: tsk for tsk in models.Task.get(genus='asset')}
+        tasks = models.Task.objects.filter(stage__project=self.project)
+        self.assertEqual(len(result), len(tasks))
+        for tsk in tasks:
+            self.assertEqual(result[str(tsk.id)]['path'], tsk.path())
+            self.assertEqual(result[str(tsk.id)]['owner'], '')
+
+    def test_get_pages_by_cursor(self):
+        self.add_entities(4)
+        first = models.Task.get(project='TST', limit='5', fields='id,entity')
+        second = models.Task.get(project='TST', limit='5', after=first['next'], fields='id,entity')
+        self.assertIsNone(second['next'])
+        ids = [tsk['id'] for tsk in first['results'] + second['results']]
+        self.assertEqual(len(ids), 8)
+        self.assertEqual(len(set(ids)), 8)
+        self.assertEqual(set(first['results'][0]), {'id', 'entity'})
+
+
+class ApiCacheTest(SetupMixin, TestCase):
+
+    def get_entities(self):
+        response = self.client.get('/api/entity', {'tag_id': str(self.tag.id)})
+        return {ent['name']: ent for ent in json.loads(response.content.decode())}
+
+    def test_repeated_get_is_served_from_cache(self):
+        self.add_entities(3)
+        self.assertEqual(len(self.get_entities()), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.get_entities()), 3)
+        self.assertEqual(cache.stats(), {'hit': 1, 'miss': 1})
+
+    def test_writes_invalidate_dependent_tables(self):
+        first, second = self.add_entities(2)
+        self.get_entities()
+        self.client.get('/api/genus')
+
+        first.link.add(second)
+        self.assertEqual(self.get_entities()['ent000']['link'], [str(second.id)])
+
+        self.tag.info = 'renamed'
+        self.tag.save()
+        self.assertEqual(self.get_entities()['ent000']['tag_info'], 'renamed')
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/genus')
+        self.assertEqual(cache.stats(), {'hit': 1, 'miss': 4})
+
+    def test_unchanged_listing_answers_not_modified(self):
+        self.add_entities(2)
+        etag = self.client.get('/api/entity', {'tag_id': str(self.tag.id)})['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/entity', {'tag_id': str(self.tag.id)}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        self.add_entities(1)
+        response = self.client.get('/api/entity', {'tag_id': str(self.tag.id)}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(json.loads(response.content.decode())), 3)
+
+    def test_weak_etag_answers_not_modified(self):
+        self.add_entities(1)
+        etag = self.client.get('/api/entity', {'tag_id': str(self.tag.id)})['ETag']
+        response = self.client.get('/api/entity', {'tag_id': str(self.tag.id)}, HTTP_IF_NONE_MATCH='W/' + etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class ApiCacheCommitTest(TransactionTestCase):
+
+    def test_versions_are_bumped_again_on_commit(self):
+        models.Genus(name='asset', info='asset').save()
+        with transaction.atomic():
+            genus = models.Genus.objects.get(name='asset')
+            genus.info = 'renamed'
+            genus.save()
+            # Another process reading now still sees the old row, under this version.
+            during = cache.model_versions(['Genus'])
+        self.assertNotEqual(cache.model_versions(['Genus']), during)
+
+
+class ApiStreamTest(SetupMixin, TestCase):
+
+    def test_stream_matches_buffered_response(self):
+        first, second = self.add_entities(3)[:2]
+        first.link.add(second)
+        for table, params in (('entity', {'tag_id': str(self.tag.id)}), ('task', {'project': 'TST'})):
+            buffered = self.client.get('/api/%s' % table, params)
+            streamed = self.client.get('/api/%s' % table, dict(params, stream='1'))
+            self.assertTrue(streamed.streaming)
+            self.assertEqual(b''.join(streamed.streaming_content), buffered.content)
+
+    def test_stream_off_buffers(self):
+        for value in ('0', 'false'):
+            response = self.client.get('/api/entity', {'tag_id': str(self.tag.id), 'stream': value})
+            self.assertFalse(response.streaming, value)
+
+    def test_stream_reads_links_per_chunk(self):
+        entities = self.add_entities(7)
+        entities[0].link.add(entities[6])
+        rows = models.Entity.stream(chunk_size=3, tag_id=str(self.tag.id))
+        with self.assertNumQueries(4):
+            result = {ent['name']: ent for ent in rows}
+        self.assertEqual(len(result), 7)
+        self.assertEqual(result['ent000']['link'], [str(entities[6].id)])
+
+
+class RendererTest(SetupMixin, TestCase):
+
+    def test_site_chrome_is_cached(self):
+        genus = models.Genus.objects.get(name='asset')
+        url = '/%s/%s/' % (self.project.id, genus.id)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        chrome = [q['sql'] for q in context.captured_queries if 'FROM "main_project"' in q['sql']]
+        self.assertEqual(chrome, [])
+
+    def test_index_lists_all_tags_in_one_page_query(self):
+        genus = models.Genus.objects.get(name='asset')
+        url = '/%s/%s/' % (self.project.id, genus.id)
+        self.add_entities(3)
+        self.add_entities(2, models.Tag.objects.get(project=self.project, name='SC'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        entity_queries = [q['sql'] for q in context.captured_queries if 'FROM "main_entity"' in q['sql']]
+        self.assertEqual(len(entity_queries), 2)
+        self.assertEqual(len(response.context['entities']), 5)
+
+        with mock.patch.object(views, 'INDEX_PAGE_SIZE', 2):
+            first = self.client.get(url).context['entities']
+            last = self.client.get(url, {'page_number': 3}).context['entities']
+        self.assertTrue(first.has_next())
+        self.assertEqual([ent.name for ent in first], ['ent000', 'ent001'])
+        self.assertFalse(last.has_next())
+
+    def test_genus_change_reloads_registry(self):
+        self.assertEqual(cache.genera.get()['shot'].info, 'shot')
+        genus = models.Genus.objects.get(name='shot')
+        genus.info = 'renamed'
+        genus.save()
+        self.assertEqual(cache.genera.get()['shot'].info, 'renamed')
+
+
+class EventsTest(TransactionTestCase):
+
+    def setUp(self):
+        for name in ('asset', 'shot', 'batch'):
+            models.Genus(name=name, info=name).save()
+        self.project = models.Project(name='TST', info='test')
+        self.project.save()
+        self.tag = models.Tag.objects.get(project=self.project, name='CH')
+        self.user = User.objects.create_user('alice')
+
+    def receive(self, project, *actions):
+        """Run actions against the database while a websocket follows project, return the events received."""
+        async def follow():
+            communicator = WebsocketCommunicator(routing.application, '/messages/%s/' % project.id)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            for action in actions:
+                await database_sync_to_async(action)()
+            received = []
+            while not await communicator.receive_nothing(0.1):
+                received.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return received
+        return async_to_sync(follow)()
+
+    def test_entity_and_owner_changes_reach_project_group(self):
+        other = models.Project(name='OTH', info='other')
+        other.save()
+        entity = models.Entity(tag=self.tag, name='Danny')
+        entity_id = str(entity.id)
+        task = {}
+
+        def add():
+            entity.save()
+            task['id'] = models.Task.objects.filter(entity=entity).values_list('id', flat=True).first()
+
+        def rename():
+            entity.name = 'Bobo'
+            entity.save()
+
+        received = self.receive(
+            self.project, add, rename,
+            lambda: models.Task.checkout(task['id'], self.user),
+            lambda: models.Task.release(task['id'], self.user),
+            entity.delete,
+        )
+        self.assertEqual(received, [
+            {'name': 'entity.added', 'id': entity_id, 'tag_id': str(self.tag.id), 'entity': 'Danny'},
+            {'name': 'task.bulk'},
+            {'name': 'entity.updated', 'id': entity_id, 'tag_id': str(self.tag.id), 'entity': 'Bobo'},
+            {'name': 'task.owner', 'id': str(task['id']), 'owner': 'alice'},
+            {'name': 'task.owner', 'id': str(task['id']), 'owner': None},
+            {'name': 'entity.deleted', 'id': entity_id},
+        ])
+        self.assertEqual(self.receive(other, lambda: models.Entity(tag=self.tag, name='Lulu').save()), [])
+
+    def test_cascade_reads_tag_projects_once(self):
+        for index in range(20):
+            models.Entity(tag=self.tag, name='ent%03d' % index).save()
+        with CaptureQueriesContext(connection) as context:
+            self.tag.delete()
+        self.assertLessEqual(len([query for query in context.captured_queries
+                                  if '"main_tag"."project_id"' in query['sql']]), 1)
+
+    def test_saved_entity_reads_project_from_its_tag(self):
+        with CaptureQueriesContext(connection) as context:
+            models.Entity(tag=self.tag, name='Danny').save()
+        self.assertFalse([query for query in context.captured_queries
+                          if query['sql'].startswith('SELECT "main_tag"."project_id"')
+                          or query['sql'].startswith('SELECT "main_tag"."id", "main_tag"."project_id"')])
+
+    def test_bulk_writes_reach_project_group(self):
+        User.objects.create_user('admin')
+        rows = [{'tag_id': str(self.tag.id), 'name': 'hero', 'info': ''}]
+        received = self.receive(
+            self.project,
+            lambda: models.Entity.bulk_set(rows),
+            lambda: main.reset(ResetTest.CSV_PATH),
+        )
+        # The reset replaced the project, without an event per deleted row.
+        self.assertEqual(received, [{'name': 'task.bulk'}, {'name': 'entity.bulk'}, {'name': 'entity.bulk'}])
+        project = models.Project.objects.get(name='TEMPLATE')
+        self.assertEqual(self.receive(project, lambda: main.reset(ResetTest.CSV_PATH, merge=True)), [])
+
+
+class ServerTest(LiveServerTestCase):
+
+    def test_asgi_entrypoint_serves_routing(self):
+        from host import asgi
+        self.assertIs(asgi.application, routing.application)
+
+    def test_bench_http_reports_latency(self):
+        out = StringIO()
+        call_command('bench_http', '%s/api/genus' % self.live_server_url, concurrency=2, duration=0.2, stdout=out)
+        self.assertRegex(out.getvalue(), r'\d+ requests, .* p95 .*\n    errors: 0')
+
+
+class DatabaseTest(TestCase):
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+    def test_sqlite_pragmas_are_set_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -64 * 1024)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+    def test_sqlite_pragmas_come_from_settings(self):
+        with self.settings(SQLITE_PRAGMAS={'busy_timeout': 250, 'cache_size': None}):
+            db.configure_connection(sender=connection.__class__, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 250)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -64 * 1024)
+            cursor.execute('PRAGMA busy_timeout = %d' % settings.SQLITE_PRAGMAS['busy_timeout'])
+
+
+class ResetTest(TestCase):
+
+    CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'setup_template.csv')
+
+    def test_reset_loads_template(self):
+        User.objects.create_user('admin')
+        with CaptureQueriesContext(connection) as context:
+            main.reset(self.CSV_PATH)
+        self.assertLess(len(context), 40)
+
+        project = models.Project.objects.get(name='TEMPLATE')
+        self.assertEqual(models.Tag.objects.filter(project=project, genus__name='asset').count(), 3)
+        self.assertEqual(models.Stage.objects.filter(project=project).count(), 5)
+        episode = models.Tag.objects.get(name='EP01')
+        self.assertEqual(episode.genus.name, 'shot')
+        self.assertEqual(models.Entity.objects.filter(tag=episode).count(), 2)
+        self.assertEqual(models.Task.objects.filter(entity__name='Danny').count(), 3)
+        self.assertEqual(models.Task.objects.filter(entity__name='SC001').count(), 2)
+        self.assertEqual(User.objects.get(username='admin').profile.role.name, 'administrator')
+
+    def test_reset_replaces_existing_rows(self):
+        User.objects.create_user('admin')
+        main.reset(self.CSV_PATH)
+        main.reset(self.CSV_PATH)
+        self.assertEqual(models.Entity.objects.count(), 7)
+        self.assertEqual(models.Genus.objects.count(), 3)
+
+    def test_replacing_reset_deletes_in_bulk(self):
+        User.objects.create_user('admin')
+        main.reset(self.CSV_PATH)
+        models.Entity.objects.get(name='Danny').link.add(models.Entity.objects.get(name='Bobo'))
+        with CaptureQueriesContext(connection) as context:
+            main.reset(self.CSV_PATH)
+        self.assertLess(len(context), 40)
+        self.assertEqual(models.Profile.objects.count(), 1)
+        self.assertFalse(models.Entity.link.through.objects.exists())
+
+    def test_reset_rejects_ambiguous_references(self):
+        def add_project(content):
+            header = content.splitlines()[0].split(',')
+            cells = dict.fromkeys(header, '')
+            cells.update({'Project|name': 'OTHER', 'Tag|name': 'CH', 'Tag|project': 'Project|OTHER',
+                          'Tag|genus': 'Genus|asset'})
+            return content.rstrip('\r\n') + '\n' + ','.join(cells[column] for column in header) + '\n'
+
+        with self.assertRaisesRegex(ValueError, r'Ambiguous reference Tag\|CH in Entity\|tag'):
+            main.reset(self.edited_csv(add_project))
+
+    def edited_csv(self, edit):
+        with open(self.CSV_PATH, encoding=main.Loader.ENCODING) as csv_file:
+            content = edit(csv_file.read())
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', encoding=main.Loader.ENCODING) as csv_file:
+            csv_file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_merge_without_changes_writes_nothing(self):
+        User.objects.create_user('admin')
+        main.reset(self.CSV_PATH)
+        with CaptureQueriesContext(connection) as context:
+            changes = main.reset(self.CSV_PATH, merge=True)
+        for table, changeset in changes.items():
+            self.assertEqual(changeset, {'create': [], 'update': [], 'delete': []}, table)
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE'))])
+
+    def test_merge_applies_differences(self):
+        User.objects.create_user('admin')
+        main.reset(self.CSV_PATH)
+        danny = models.Entity.objects.get(name='Danny')
+        path = self.edited_csv(lambda content: content.replace('Bobo,布布', 'Bobo,波波').replace('Lulu,', 'Momo,'))
+
+        changes = main.reset(path, merge=True)
+        self.assertEqual(changes['Entity'], {'create': ['Momo'], 'update': ['Bobo'], 'delete': ['Lulu']})
+        self.assertEqual(models.Entity.objects.get(name='Bobo').info, '波波')
+        self.assertFalse(models.Entity.objects.filter(name='Lulu').exists())
+        self.assertEqual(models.Task.objects.filter(entity__name='Momo').count(), 3)
+        self.assertEqual(models.Entity.objects.get(name='Danny').pk, danny.pk)
+
+    def test_merge_refuses_duplicate_natural_keys(self):
+        User.objects.create_user('admin')
+        main.reset(self.CSV_PATH)
+        lulu = models.Entity.objects.get(name='Lulu')
+        models.Entity.objects.create(name='Lulu', tag=lulu.tag, info='copy')
+
+        with self.assertRaisesMessage(ValueError, 'Several Entity rows named Lulu'):
+            main.reset(self.CSV_PATH, merge=True)
+        self.assertEqual(models.Entity.objects.filter(name='Lulu').count(), 2)
+
+    def test_merge_dry_run_rolls_back(self):
+        User.objects.create_user('admin')
+        main.reset(self.CSV_PATH)
+        path = self.edited_csv(lambda content: content.replace('Lulu,', 'Momo,'))
+
+        out = StringIO()
+        call_command('setup', path, merge=True, dry_run=True, stdout=out)
+        self.assertIn('Entity: 1 created, 0 updated, 1 deleted', out.getvalue())
+        self.assertTrue(models.Entity.objects.filter(name='Lulu').exists())
+        self.assertFalse(models.Entity.objects.filter(name='Momo').exists())
@@ -3,32 +3,68 @@ from __future__ import unicode_literals
 
 import os
 import json
+import uuid
 import markdown
 
 from django.contrib.auth import authenticate, login, logout
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import HttpResponse, HttpResponseRedirect
+from django.core.paginator import Paginator
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotModified, StreamingHttpResponse, \
+    HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotFound, HttpResponseNotAllowed
 from django.shortcuts import render
-
-from main import models
+from django.utils.http import parse_etags
+
+from main import cache, models
+
+
+INDEX_PAGE_SIZE = 200
+
+# /api/<table> read with GET and written with POST, /api/<table>/bulk written with POST.
+QUERIES = {
+    'project': models.Project.all,
+    'entity': models.Entity.get,
+    'stage': models.Stage.get,
+    'task': models.Task.get,
+    'genus': models.Genus.get,
+    'tag': models.Tag.get,
+}
+STREAMS = {
+    'entity': models.Entity.stream,
+    'task': models.Task.stream,
+}
+MODIFIERS = {
+    'project': models.Project.set,
+    'tag': models.Tag.set,
+    'stage': models.Stage.set,
+    'entity': models.Entity.set,
+    'task': models.Task.set,
+}
+BULK_MODIFIERS = {
+    'entity': models.Entity.bulk_set,
+}
+TASK_ACTIONS = {
+    'checkout': models.Task.checkout,
+    'release': models.Task.release,
+}
 
 
 def renderer(func):
     def inner(request, project_id, **kwargs):
-        try:
-            current_project = models.Project.objects.get(id=project_id)
-            request.session['current_project_id'] = str(project_id)
-        except ObjectDoesNotExist:
+        projects = cache.projects.get()
+        genera = cache.genera.get()
+        current_project = next((prj for prj in projects if prj.id == project_id), None)
+        if current_project is None:
             request.session['current_project_id'] = None
             return HttpResponseRedirect('/')
+        request.session['current_project_id'] = str(project_id)
 
         context = func(request, current_project, **kwargs)
         context['current_path'] = request.path
         context['current_project'] = current_project
-        context['projects'] = models.Project.all()
-        context['genus_asset'] = models.Genus.objects.get(name='asset')
-        context['genus_shot'] = models.Genus.objects.get(name='shot')
-        context['genus_batch'] = models.Genus.objects.get(name='batch')
+        context['projects'] = projects
+        context['genus_asset'] = genera['asset']
+        context['genus_shot'] = genera['shot']
+        context['genus_batch'] = genera['batch']
         context['user'] = request.user
         for key, val in request.GET.items():
             context[key] = val
@@ -38,21 +74,20 @@ def renderer(func):
 
 @renderer
 def index_project(request, project, genus_id):
-    try:
-        current_genus = models.Genus.objects.get(id=genus_id)
-    except ObjectDoesNotExist:
-        current_genus = models.Genus.objects.get(name='asset')
+    genera = cache.genera.get()
+    current_genus = next((gns for gns in genera.values() if gns.id == genus_id), genera['asset'])
     request.session['current_genus_id'] = str(current_genus.id)
 
     tags = models.Tag.objects.filter(genus=current_genus, project=project)
-    entities = []
-    for tag in tags:
-        entities += models.Entity.objects.filter(tag=tag)
+    entities = models.Entity.objects.filter(
+        tag__genus=current_genus,
+        tag__project=project,
+    ).select_related('tag').order_by('tag__name', 'name')
     return {
         'page': 'index.html',
         'current_genus': current_genus,
         'tags': tags,
-        'entities': entities,
+        'entities': Paginator(entities, INDEX_PAGE_SIZE).get_page(request.GET.get('page_number')),
     }
 
 
@@ -140,48 +175,103 @@ def object_delete(request, object_id):
 
 
 def api(request):
-    table = request.path.split('/')[-1]
-    if not table:
+    path = request.path_info.strip('/').split('/')[1:]
+    if not path:
         return HttpResponse('')
-    if table == 'auth':
+    table = path[0]
+    if path == ['auth']:
         return api_auth(request)
-    if request.method == 'GET':
-        return api_get(request, table)
-    elif request.method == 'POST':
-        return api_set(request, table)
+    if path == ['cache']:
+        return HttpResponse(json.dumps(cache.stats()))
+    if path == [table, 'bulk'] and table in BULK_MODIFIERS:
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        return api_bulk(request, table)
+    if len(path) == 2 and table == 'task' and path[1] in TASK_ACTIONS:
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        return api_task_owner(request, path[1])
+    if path == [table] and table in QUERIES:
+        allowed = ['GET', 'POST'] if table in MODIFIERS else ['GET']
+        if request.method == 'GET':
+            return api_get(request, table)
+        elif request.method == 'POST' and 'POST' in allowed:
+            return api_set(request, table)
+        return HttpResponseNotAllowed(allowed)
+    return HttpResponseNotFound(json.dumps({'error': 'unknown api %s' % '/'.join(path)}))
 
 
 def api_get(request, table):
     flt = {}
-    query_dict = {
-        'project': models.Project.all,
-        'entity': models.Entity.get,
-        'stage': models.Stage.get,
-        'task': models.Task.get,
-        'genus': models.Genus.get,
-        'tag': models.Tag.get,
-    }
     for key in request.GET:
         flt[key] = request.GET[key]
-    return HttpResponse(json.dumps(query_dict[table](**flt)))
+
+    digest = cache.fingerprint(table, flt)
+    etag = '"%s"' % digest
+    stream = flt.pop('stream', '').lower()
+    if stream not in ('', '0', 'false', '1', 'true'):
+        return HttpResponseBadRequest(json.dumps({'error': 'Invalid stream %s' % stream}))
+    try:
+        # If-None-Match uses the weak comparison, nginx marks the ETag weak when it gzips the body.
+        if etag in [tag[2:] if tag.startswith('W/') else tag
+                    for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))]:
+            response = HttpResponseNotModified()
+        elif stream in ('1', 'true') and table in STREAMS:
+            response = StreamingHttpResponse(stream_json(STREAMS[table](**flt)))
+        else:
+            response = HttpResponse(cache.fetch(table, flt, lambda: json.dumps(QUERIES[table](**flt)), digest))
+    except ValueError as e:
+        return HttpResponseBadRequest(json.dumps({'error': str(e)}))
+    response['ETag'] = etag
+    return response
+
+
+def stream_json(rows):
+    # Same bytes as json.dumps(list(rows)), emitted one element at a time.
+    yield '['
+    for i, row in enumerate(rows):
+        yield (', ' if i else '') + json.dumps(row)
+    yield ']'
 
 
 def api_set(request, table):
     form = dict(request.POST)
-    modify_dict = {
-        'project': models.Project.set,
-        'tag': models.Tag.set,
-        'stage': models.Stage.set,
-        'entity': models.Entity.set,
-        'task': models.Task.set,
-    }
     if request.FILES:
         for f in request.FILES:
             form[f] = request.FILES[f]
-    modify_dict[table](form)
+    MODIFIERS[table](form)
     return HttpResponseRedirect(request.GET['next'])
 
 
+def api_bulk(request, table):
+    try:
+        ids = BULK_MODIFIERS[table](json.loads(request.body.decode('utf-8')))
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(json.dumps({'error': str(e)}))
+    return HttpResponse(json.dumps({'ids': ids}))
+
+
+def api_task_owner(request, action):
+    """Check a task out to the session user or release it, answering 409 when another user holds it
+    and 404 when there is no such task."""
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden(json.dumps({'success': False, 'owner': None}))
+    try:
+        # Checked up front, a ValidationError raised by update() would break the transaction.
+        task_id = uuid.UUID(request.POST.get('id', ''))
+    except ValueError:
+        return HttpResponseBadRequest(json.dumps({'error': 'invalid task id %s' % request.POST.get('id', '')}))
+    success = TASK_ACTIONS[action](task_id, request.user)
+    owners = list(models.Task.objects.filter(id=task_id).values_list('owner__username', flat=True))
+    if not owners:
+        return HttpResponseNotFound(json.dumps({'error': 'unknown task %s' % task_id}))
+    owner = owners[0]
+    response = HttpResponse(json.dumps({'success': success, 'owner': owner}))
+    if not success:
+        response.status_code = 409
+    return response
+
+
 def api_auth(request):
     if request.method == 'GET':
         return HttpResponse(json.dumps(request.user.is_authenticated))
@@ -1,29 +1,70 @@
 import json
+import time
 import pickle
 import socket
+import threading
+from collections import OrderedDict
 from socket import error
 import requests
-from requests.exceptions import ConnectionError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from requests.packages.urllib3.util.retry import Retry
 from maya import cmds
 
 from .utils import *
 
 
-session = requests.Session()
+# (connect, read) seconds of every request
+TIMEOUT = (3.05, 30)
+# Idempotent requests (GET) are retried after 0.5s, 1s, 2s, POST is never replayed.
+RETRY = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504))
+
+
+def new_session():
+    """Session keeping its connections to the server alive in a pool shared by every call."""
+    sess = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=8, max_retries=RETRY)
+    sess.mount('http://', adapter)
+    sess.mount('https://', adapter)
+    return sess
+
+
+session = new_session()
+
+# Listings younger than CACHE_TTL seconds are answered from memory, older ones are
+# revalidated with If-None-Match. At most CACHE_SIZE listings are kept.
+CACHE_TTL = 10
+CACHE_SIZE = 256
+# (host, table, filters) -> (expiry, etag, body), least recently used first
+responses = OrderedDict()
+# Tables whose listings embed the rows of another table, see DEPENDENCIES in main.cache
+DEPENDENTS = {
+    'project': ('tag', 'entity', 'stage', 'task'),
+    'tag': ('entity', 'task'),
+    'entity': ('task', ),
+    'stage': ('task', ),
+}
+# Debug counters of get_data: served from memory, sent to the server
+counters = {'hit': 0, 'network': 0}
+# Guards responses and counters, listings are fetched from worker threads (samgui.RequestThread)
+lock = threading.Lock()
+
+
+def api_url(host, table):
+    return 'http://%s/api/%s' % (host, table)
 
 
 def auth_stats(host):
-    return json.loads(session.get("http://%s/api/auth" % host).text)
+    return json.loads(session.get(api_url(host, 'auth'), timeout=TIMEOUT).text)
 
 
 def login(host, username, password):
-    server = "http://%s/api/auth" % host
     kwargs = {
         'username': username,
         'password': password,
     }
     try:
-        response = session.post(server, data=kwargs)
+        response = session.post(api_url(host, 'auth'), data=kwargs, timeout=TIMEOUT)
         if json.loads(response.text):
             cmds.optionVar(sv=(OPT_USERNAME, json.loads(response.text)['name']))
             cmds.optionVar(sv=(OPT_COOKIES, pickle.dumps(session.cookies)))
@@ -32,23 +73,21 @@ def login(host, username, password):
             cmds.optionVar(remove=OPT_USERNAME)
             cmds.optionVar(remove=OPT_COOKIES)
             return AUTH_FAILED
-    except ConnectionError:
+    except RequestException:
         return CONNECT_FAILED
     except ValueError:
         return CONNECT_FAILED
 
 
 def logout():
-    global session
     cmds.optionVar(remove=OPT_USERNAME)
     cmds.optionVar(remove=OPT_COOKIES)
-    session.close()
-    session = requests.Session()
+    session.cookies.clear()
+    responses.clear()
 
 
 def update(host, table, **fields):
-    server = "http://%s/api" % host
-    url = "{server}/{table}".format(**locals())
+    url = api_url(host, table)
     kwargs = {'data': {}}
     for field in fields:
         if field == 'file':
@@ -57,28 +96,94 @@ def update(host, table, **fields):
             kwargs['data'][field] = fields[field]
 
     try:
-        session.post(url, **kwargs)
+        session.post(url, timeout=TIMEOUT, **kwargs)
         return True
-    except ConnectionError:
+    except RequestException:
         return False
 
 
 def get_data(table, **filters):
-    host = cmds.optionVar(q=OPT_HOST)
-    url = 'http://%s/api/%s?' % (host, table)
-    for field, value in filters.items():
-        url += '{field}={value}&'.format(**locals())
+    return fetch(cmds.optionVar(q=OPT_HOST), table, filters)
+
+
+def fetch(host, table, filters):
+    """get_data from a given host, safe to call outside the main thread as it doesn't touch maya."""
+    key = (host, table, tuple(sorted(filters.items())))
+    with lock:
+        cached = responses.pop(key, None)
+        fresh = cached is not None and cached[0] > time.time()
+        if fresh:
+            responses[key] = cached
+        counters['hit' if fresh else 'network'] += 1
+    if fresh:
+        return json.loads(cached[2])
+
+    etag, body = cached[1:] if cached else (None, None)
+    headers = {'If-None-Match': etag} if etag else {}
     try:
-        return json.loads(requests.get(url).text)
+        response = session.get(api_url(host, table), params=filters, headers=headers, timeout=TIMEOUT)
+        if response.status_code != 304:
+            body = response.text
+            etag = response.headers.get('ETag')
+        if etag:
+            with lock:
+                responses[key] = (time.time() + CACHE_TTL, etag, body)
+                while len(responses) > CACHE_SIZE:
+                    responses.popitem(last=False)
+        return json.loads(body)
     except ValueError:
         return []
-    except ConnectionError:
+    except RequestException:
+        if cached:
+            with lock:
+                responses.setdefault(key, cached)
         return []
 
 
 def set_data(table, **filters):
     host = cmds.optionVar(q=OPT_HOST)
-    return update(host, table, **filters)
+    result = update(host, table, **filters)
+    invalidate(table)
+    return result
+
+
+def invalidate(table):
+    """Forget the listings of table and of the tables showing its rows."""
+    tables = (table, ) + DEPENDENTS.get(table, ())
+    with lock:
+        for key in list(responses):
+            if key[1] in tables:
+                del responses[key]
+
+
+def cache_stats():
+    return dict(counters, size=len(responses))
+
+
+def checkout_task(task_id):
+    """Claim a free task for the logged in user, the result tells who owns it afterwards."""
+    return task_owner('checkout', task_id)
+
+
+def release_task(task_id):
+    """Give back a task held by the logged in user."""
+    return task_owner('release', task_id)
+
+
+def task_owner(action, task_id):
+    host = cmds.optionVar(q=OPT_HOST)
+    url = api_url(host, 'task/%s' % action)
+    try:
+        result = json.loads(session.post(url, data={'id': task_id}, timeout=TIMEOUT).text)
+    except ValueError:
+        return {'success': False, 'owner': None}
+    except RequestException:
+        return {'success': False, 'owner': None}
+    finally:
+        # After the request, a listing fetched meanwhile could predate the change.
+        invalidate('task')
+    # Errors such as an unknown task answer {'error': ...}.
+    return {'success': bool(result.get('success')), 'owner': result.get('owner')}
 
 
 def ue_command(data=None):
@@ -1,12 +1,13 @@
 import os
+import io
 import json
 import pickle
-import requests
-from requests.exceptions import ConnectionError
+import hashlib
+from requests.exceptions import RequestException
 from Qt.QtNetwork import QNetworkAccessManager, QNetworkRequest, QNetworkReply
 from Qt.QtWidgets import QDialog, QWidget, QVBoxLayout, QSizePolicy, QFileDialog
 from Qt.QtGui import QImage, QIcon
-from Qt.QtCore import QObject, Signal, QUrl, Qt, QThread
+from Qt.QtCore import QObject, Signal, QUrl, Qt, QRunnable, QThreadPool
 from Qt.QtCompat import loadUi, wrapInstance
 
 from maya.app.general.mayaMixin import MayaQWidgetDockableMixin
@@ -44,7 +45,12 @@ def access(force=False):
         if host == '*':
             return samkit.AUTH_ABORT
 
-        result = samkit.AUTH_SUCCESS if samkit.auth_stats(host) else samkit.login(host, username, password)
+        try:
+            authenticated = samkit.auth_stats(host)
+        except (RequestException, ValueError):
+            # login tells a server that can't be reached from wrong credentials.
+            authenticated = False
+        result = samkit.AUTH_SUCCESS if authenticated else samkit.login(host, username, password)
 
         cmds.optionVar(sv=(samkit.OPT_HOST, host))
         cmds.optionVar(sv=(samkit.OPT_PROJECT, project))
@@ -72,7 +78,7 @@ def access(force=False):
                 return samkit.AUTH_FAILED
             else:
                 return samkit.AUTH_SUCCESS
-        except ConnectionError:
+        except (RequestException, ValueError):
             samkit.clear_ov()
             return samkit.CONNECT_FAILED
 
@@ -171,9 +177,9 @@ class AuthDialog(QDialog):
         self.host = '%s:%s' % (self.ui.le_host.text(), self.ui.le_port.text())
         while self.ui.cb_project.count():
             self.ui.cb_project.removeItem(0)
-        url = 'http://%s/api/project' % self.host
+        url = samkit.samcon.api_url(self.host, 'project')
         try:
-            result = requests.get(url)
+            result = samkit.samcon.session.get(url, timeout=samkit.samcon.TIMEOUT)
             projects = json.loads(result.text)
             for p in projects:
                 self.ui.cb_project.addItem(p['info'])
@@ -182,7 +188,7 @@ class AuthDialog(QDialog):
             self.ui.btn_test.setStyleSheet('color: #000000; background-color: #33CC33')
             self.ui.wgt_workspace.setEnabled(True)
             self.refresh()
-        except ConnectionError:
+        except RequestException:
             self.ui.btn_test.setStyleSheet('color: #000000; background-color: #CC3333')
         except ValueError:
             self.ui.btn_test.setStyleSheet('color: #000000; background-color: #CC3333')
@@ -227,68 +233,256 @@ class AuthDialog(QDialog):
                self.ui.le_pwd.text()
 
 
+class ThumbCache(object):
+    """Thumbnails on disk by url, with the ETag/Last-Modified they were served with.
+
+    Each one is a data file plus a json of its validators. The data file mtime is the
+    last use, the least recently used are evicted once the files exceed size bytes.
+    """
+
+    SIZE = 200 * 1024 * 1024
+
+    def __init__(self, root, size=None):
+        self.root = root
+        self.size = size or self.SIZE
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    @classmethod
+    def default(cls):
+        workspace = samkit.getenv(samkit.OPT_WORKSPACE) if samkit.hasenv(samkit.OPT_WORKSPACE) else ''
+        root = workspace if workspace and os.path.isdir(workspace) else samkit.TMP_PATH
+        return cls(os.path.join(root, '.samkit_thumbs'))
+
+    def path(self, url):
+        return os.path.join(self.root, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def get(self, url):
+        """Return the data of url, None when it isn't cached."""
+        path = self.path(url)
+        try:
+            with io.open(path, 'rb') as fp:
+                data = fp.read()
+            os.utime(path, None)
+            return data
+        except (IOError, OSError):
+            return None
+
+    def validators(self, url):
+        try:
+            with io.open('%s.json' % self.path(url), 'r', encoding='utf-8') as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def put(self, url, data, etag=None, last_modified=None):
+        path = self.path(url)
+        try:
+            with io.open(path, 'wb') as fp:
+                fp.write(data)
+            with io.open('%s.json' % path, 'w', encoding='utf-8') as fp:
+                fp.write(json.dumps({'url': url, 'etag': etag, 'last_modified': last_modified}, ensure_ascii=False))
+        except (IOError, OSError):
+            pass
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith('.json') or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.size:
+                break
+            for victim in (path, '%s.json' % path):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
+
+
 class ImageHub(QObject):
+    """Downloads thumbnails, up to concurrency at a time, into an url -> QImage cache shared by every hub.
+
+    Thumbnails already on disk (see ThumbCache) show up at once and are revalidated
+    with the server once per session.
+    """
 
     ImageRequested = Signal(dict)
+    CONCURRENCY = 4
     manager = QNetworkAccessManager()
     manager_default = QNetworkAccessManager()
     icon_set = {}
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, concurrency=None, disk=None):
         super(ImageHub, self).__init__(parent)
         self.ready = False
+        self.concurrency = concurrency or self.CONCURRENCY
+        self.disk = disk or ThumbCache.default()
         self.default_image = QImage()
+        # urls waiting for a download, the most wanted first, and urls being downloaded
+        self.queue = []
+        self.pending = set()
         self.manager.finished.connect(self.on_finished)
         self.manager_default.finished.connect(self.on_default_finished)
 
         req = QNetworkRequest(QUrl('http://%s/media/thumbs/default.png' % cmds.optionVar(q=samkit.OPT_HOST)))
         self.manager_default.get(req)
 
-    def get(self, urls):
-        self.icon_set = {}
+    def get(self, urls, start=True):
+        """Show the cached thumbnails of urls and queue the others, start=False leaves the downloads to start()."""
+        cached = {}
+        self.queue = []
         for url in urls:
-            self.icon_set[url] = None
-
+            if url in self.icon_set:
+                cached[url] = self.icon_set[url]
+                continue
+            data = self.disk.get(url)
+            if data is not None:
+                cached[url] = QImage()
+                cached[url].loadFromData(data)
+            if url not in self.pending and url not in self.queue:
+                self.queue.append(url)
+        if cached:
+            self.ImageRequested.emit(cached)
+
+        if start:
+            self.start()
+
+    def start(self):
         if self.ready:
             self.request()
 
+    def prioritize(self, urls):
+        """Move urls, e.g. those of the visible rows, to the front of the queue."""
+        wanted = [url for url in urls if url in self.queue]
+        self.queue = wanted + [url for url in self.queue if url not in wanted]
+
     def request(self):
-        for url, image in self.icon_set.items():
-            if not image:
-                host = cmds.optionVar(q=samkit.OPT_HOST)
-                req = QNetworkRequest(QUrl('http://%s%s' % (host, url)))
-                self.manager.get(req)
-                break
+        host = cmds.optionVar(q=samkit.OPT_HOST)
+        while self.queue and len(self.pending) < self.concurrency:
+            url = self.queue.pop(0)
+            req = QNetworkRequest(QUrl('http://%s%s' % (host, url)))
+            req.setAttribute(QNetworkRequest.User, url)
+            validators = self.disk.validators(url)
+            if validators.get('etag'):
+                req.setRawHeader(b'If-None-Match', validators['etag'].encode('utf-8'))
+            if validators.get('last_modified'):
+                req.setRawHeader(b'If-Modified-Since', validators['last_modified'].encode('utf-8'))
+            self.pending.add(url)
+            self.manager.get(req)
 
     def on_finished(self, reply):
-        url = reply.url().path()
+        url = reply.request().attribute(QNetworkRequest.User)
+        if url not in self.pending:
+            return
         image = QImage()
+        status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        data = self.disk.get(url) if status == 304 else None
 
-        if reply.error() == QNetworkReply.NoError:
-            data = reply.readAll()
+        if data is not None:
+            image.loadFromData(data)
+        elif reply.error() == QNetworkReply.NoError and status != 304:
+            data = reply.readAll().data()
             image.loadFromData(data)
+            self.disk.put(
+                url, data,
+                etag=reply.rawHeader(b'ETag').data().decode('utf-8') or None,
+                last_modified=reply.rawHeader(b'Last-Modified').data().decode('utf-8') or None,
+            )
         else:
-            image = self.default_image
+            data = self.disk.get(url)
+            if data is not None:
+                image.loadFromData(data)
+            else:
+                image = None
 
-        self.icon_set[url] = image
-        self.ImageRequested.emit(self.icon_set)
+        reply.deleteLater()
+        self.pending.discard(url)
+        if image is None:
+            # Not kept in icon_set, the next get() tries the download again.
+            image = self.default_image
+        else:
+            self.icon_set[url] = image
+        self.ImageRequested.emit({url: image})
         self.request()
+        if not self.queue and not self.pending:
+            self.disk.evict()
 
     def on_default_finished(self, reply):
         if reply.error() == QNetworkReply.NoError:
             data = reply.readAll()
             self.default_image.loadFromData(data)
             self.ready = True
-            self.request()
+            self.start()
+
 
+class RequestSignals(QObject):
 
-class RequestThread(QThread):
+    acquired = Signal(object, int, object)
 
-    acquired = Signal(list)
 
-    def __init__(self, url):
-        super(RequestThread, self).__init__()
-        self._url = url
+class RequestRunnable(QRunnable):
+
+    def __init__(self, key, serial, latest, host, table, filters, signals):
+        super(RequestRunnable, self).__init__()
+        # Auto deleted by the pool once run() returns, RequestThread keeps no reference.
+        self.key = key
+        self.serial = serial
+        self._latest = latest
+        self._host = host
+        self._table = table
+        self._filters = filters
+        self._signals = signals
 
     def run(self):
-        pass
+        if self._latest.get(self.key) != self.serial:
+            # Superseded while queued.
+            return
+        data = []
+        try:
+            data = samkit.samcon.fetch(self._host, self._table, self._filters)
+        finally:
+            self._signals.acquired.emit(self.key, self.serial, data)
+
+
+class RequestThread(QObject):
+    """Runs samcon listings on a shared QThreadPool, results arrive on the UI thread via acquired.
+
+    Requests are coalesced by key: a new fetch for a key makes the previous one skip
+    its request if it hasn't started yet and drops its result if it has, so only the
+    data of the latest request is delivered. cancel does the same without a new fetch.
+    """
+
+    acquired = Signal(object, object)
+    pool = QThreadPool()
+    pool.setMaxThreadCount(4)
+
+    def __init__(self, parent=None):
+        super(RequestThread, self).__init__(parent)
+        self._serial = 0
+        # key -> serial of the latest request, read by the runnables
+        self._latest = {}
+        self._signals = RequestSignals()
+        self._signals.acquired.connect(self.on_acquired)
+
+    def fetch(self, key, table, **filters):
+        self._serial += 1
+        # maya.cmds isn't thread safe, the host is read here.
+        host = cmds.optionVar(q=samkit.OPT_HOST)
+        self._latest[key] = self._serial
+        self.pool.start(RequestRunnable(key, self._serial, self._latest, host, table, filters, self._signals))
+
+    def cancel(self, key):
+        """Skip the request for a key if it hasn't started yet and drop its result if it has."""
+        self._latest.pop(key, None)
+
+    def on_acquired(self, key, serial, data):
+        if self._latest.get(key) != serial:
+            return
+        del self._latest[key]
+        self.acquired.emit(key, data)
@@ -7,7 +7,7 @@ from Qt.QtWidgets import QWidget
 import pyblish.api
 import pyblish.util
 import samkit
-from . import setup_ui, ImageHub
+from . import setup_ui, ImageHub, RequestThread
 
 
 class GenusModel(QAbstractListModel):
@@ -26,9 +26,14 @@ class GenusModel(QAbstractListModel):
         # DATA FORMAT: [id, name, info]
         self._data = []
         self.current_id = ''
+        self._requests = RequestThread(self)
+        self._requests.acquired.connect(self.on_acquired)
 
     def update(self):
-        self._data = samkit.get_data('genus')
+        self._requests.fetch('genus', 'genus')
+
+    def on_acquired(self, key, data):
+        self._data = data
         self.dataChanged.emit(QModelIndex(), QModelIndex())
         self.notify(0)
 
@@ -61,10 +66,15 @@ class TagModel(QAbstractListModel):
         # DATA FORMAT: [id, name, info, genus_id, genus_name, genus_info]
         self._data = []
         self.current_id = self._data[0]['id'] if self._data else ''
+        self._requests = RequestThread(self)
+        self._requests.acquired.connect(self.on_acquired)
         self._genus.genusChanged.connect(self.update)
 
     def update(self, genus_id):
-        self._data = samkit.get_data('tag', genus_id=genus_id, project_id=samkit.getenv(samkit.OPT_PROJECT_ID))
+        self._requests.fetch('tag', 'tag', genus_id=genus_id, project_id=samkit.getenv(samkit.OPT_PROJECT_ID))
+
+    def on_acquired(self, key, data):
+        self._data = data
         self.dataChanged.emit(QModelIndex(), QModelIndex())
         self.notify(0)
 
@@ -99,19 +109,30 @@ class AssetModel(QAbstractListModel):
             self.IdRole: 'id',
         }
         self._filter = ''
-        # DATA FORMAT: [id, name, info, genus_id, genus_name, genus_info, tag_id, tag_name, tag_info, link, thumb]
+        # DATA FORMAT: [id, name, info, genus_name, thumb]
         self._data = []
         self._data_filter = []
         self._tag = tag
         self._hub = ImageHub()
+        self._requests = RequestThread(self)
+        self._requests.acquired.connect(self.on_acquired)
         self._tag.tagChanged.connect(self.update)
         self._hub.ImageRequested.connect(self.image_received)
 
     def update(self, tag_id=None):
         tag_id = tag_id if tag_id else self._tag.current_id
-        self._data = samkit.get_data('entity', tag_id=tag_id)
+        self._requests.fetch('entity', 'entity', tag_id=tag_id, fields='id,name,info,genus_name,thumb')
+
+    def on_acquired(self, key, data):
+        self._data = data
+        # Queued only: filtering makes the view prioritize the visible rows, then the downloads start.
+        self._hub.get([asset['thumb'] for asset in self._data], start=False)
         self.filter(self._filter)
-        self._hub.get([asset['thumb'] for asset in self._data])
+        self._hub.start()
+
+    def prioritize(self, rows):
+        """Download the thumbnails of rows, e.g. the visible ones, first."""
+        self._hub.prioritize([self._data_filter[row]['thumb'] for row in rows if row < len(self._data_filter)])
 
     def filter(self, txt):
         self._filter = txt
@@ -3,7 +3,7 @@ from Qt.QtGui import QIcon, QPixmap
 from Qt.QtCore import Signal, Qt
 
 import samkit
-from . import access, setup_ui, Docker
+from . import access, setup_ui, Docker, RequestThread
 from .model import GenusModel, TagModel, AssetModel, PluginModel, PluginItem, ResultItem
 from .delegate import AssetDelegate, TaskDelegate, PluginDelegate
 
@@ -28,6 +28,7 @@ class DockerMain(Docker):
         self.detail_thumb = ''
         self.history = []
         self.clipboard = QApplication.clipboard()
+        self.requests = RequestThread(self)
 
         genus_model = GenusModel()
         tag_model = TagModel(genus_model)
@@ -64,6 +65,8 @@ class DockerMain(Docker):
         tag_model.dataChanged.connect(self.refresh_repository_tag)
         asset_model.dataChanged.connect(self.refresh_repository_asset)
         asset_model.filtered.connect(self.refresh_repository_asset)
+        asset_model.filtered.connect(self.refresh_repository_thumbs)
+        self.ui.lv_asset.verticalScrollBar().valueChanged.connect(self.refresh_repository_thumbs)
         self.ui.cb_genus.currentIndexChanged.connect(genus_model.notify)
         self.ui.cb_tag.currentIndexChanged.connect(tag_model.notify)
         self.ui.tb_add.clicked.connect(lambda *_: self.open_detail())
@@ -97,6 +100,7 @@ class DockerMain(Docker):
         plugin_model.resultGenerated.connect(self.set_result_widget)
         plugin_model.dataChanged.connect(self.refresh_check_state)
         self.ui.te_comment.textChanged.connect(self.refresh_check_state)
+        self.requests.acquired.connect(self.refresh_workspace_tasks)
 
         samkit.scriptJob(event=['SceneOpened', self.refresh_workspace])
         samkit.evalDeferred(self.refresh_repository)
@@ -140,6 +144,13 @@ class DockerMain(Docker):
         self.ui.lv_asset.setModel(None)
         self.ui.lv_asset.setModel(model)
 
+    def refresh_repository_thumbs(self, *_):
+        view = self.ui.lv_asset
+        model = view.model()
+        area = view.viewport().rect()
+        rows = [row for row in range(model.rowCount()) if view.visualRect(model.index(row, 0)).intersects(area)]
+        model.prioritize(rows)
+
     def refresh_repository_context_menu(self, position):
         current_index = self.ui.lv_asset.currentIndex()
         data_task = []
@@ -258,9 +269,17 @@ class DockerMain(Docker):
         while self.ui.lw_task.count():
             self.ui.lw_task.takeItem(0)
         if not samkit.hasenv(samkit.OPT_USERNAME):
+            # Logged out, a listing still running must not refill the list.
+            self.requests.cancel('workspace')
             return
 
-        data = samkit.get_data('task', owner=samkit.getenv(samkit.OPT_USERNAME))
+        self.requests.fetch('workspace', 'task', owner=samkit.getenv(samkit.OPT_USERNAME))
+
+    def refresh_workspace_tasks(self, key, data):
+        if not samkit.hasenv(samkit.OPT_USERNAME):
+            return
+        while self.ui.lw_task.count():
+            self.ui.lw_task.takeItem(0)
         for task in data:
             item = TaskItem(task, self)
             item.setSizeHint(item.widget.sizeHint())
@@ -17,6 +17,8 @@ __all__ = [
     'logout',
     'get_data',
     'set_data',
+    'checkout_task',
+    'release_task',
     'ue_command',
     'getenv',
     'hasenv',
@@ -53,6 +55,8 @@ login = samcon.login
 logout = samcon.logout
 get_data = samcon.get_data
 set_data = samcon.set_data
+checkout_task = samcon.checkout_task
+release_task = samcon.release_task
 ue_command = samcon.ue_command
 
 
@@ -140,7 +144,7 @@ def revert(task):
     context = get_context('id')
     if task['id'] == context:
         new_file()
-    samcon.set_data('task', id=task['id'], owner='')
+    samcon.release_task(task['id'])
 
 
 def merge(task):
@@ -180,8 +184,16 @@ def checkout(task):
             )
             return False
 
-    samcon.set_data('task', id=task['id'], owner=getenv(OPT_USERNAME))
-    task['owner'] = getenv(OPT_USERNAME)
+    result = samcon.checkout_task(task['id'])
+    if not result['success']:
+        owner = result['owner']
+        cmds.inViewMessage(
+            message='Checked out by <font color="yellow">%s</font>.' % owner if owner else 'Can\'t check out.',
+            position='midCenter',
+            dragKill=True
+        )
+        return False
+    task['owner'] = result['owner']
 
     if current_path:
         cmds.file(save=True)
@@ -80,5 +80,5 @@ class EntityIntegrator(pyblish.api.InstancePlugin):
 
         shutil.copyfile(current_path, source_path)
 
-        samkit.set_data('task', id=task['id'], owner='')
+        samkit.release_task(task['id'])
         samkit.new_file()